@@ -10,31 +10,18 @@
 
 
 # Соберем все отдельные текстовые документы в единый файл.
-# pbar - объект индикатора выполнения. После этого идет цикл итераций по каталогам train & test внутри основного каталога и прочли
-# отдельные текстовые файлы из подкаталогов pos & neg, которые мы собрали и записали в DataFrame с меткой 1-положительные, 0- отрицательные.
-import pyprind
+# Проходим по каталогам train & test внутри основного каталога и читаем отдельные текстовые файлы из подкаталогов pos & neg,
+# метка 1 - положительные, 0 - отрицательные. Добавлять каждый документ в DataFrame через df.append нельзя: каждый вызов
+# копирует весь DataFrame, и время сборки растет квадратично. ingest_imdb читает файлы пулом потоков в заранее
+# выделенный список и строит DataFrame один раз.
+# Поскольку метки классов отсортированы, элементы перемешиваются функцией permutation (np.random.seed(0)), и "зашафленный"
+# DataFrame сохраняется в единый файл, чтобы не терять время на сбор всех файлов в подкаталоге. index=True строит
+# также индекс смещений для чтения отзывов в произвольном порядке (CorpusReader).
+# Из командной строки: python -m movieclassifier.ingest ./data/aclImdb ./data/movie_data.csv --columnar --index
 import pandas as pd
-import os
+from movieclassifier.ingest import ingest_imdb
 
-pbar=pyprind.ProgBar(50000)
-labels={'pos':1, 'neg': 0}
-df=pd.DataFrame()
-for s in ('test','train'):
-    for l in ('pos', 'neg'):
-        path='./data/aclImdb/%s/%s' % (s,l)
-        for file in os.listdir(path):
-            with open(os.path.join(path, file), 'r', encoding='utf-8') as infile:
-                txt=infile.read()
-            df=df.append([[txt, labels[l]]], ignore_index=True)
-            pbar.update()
-df.columns = ['review', 'sentiment']
-
-# Поскольку метки классов сейчас в исходном DataFrame отсортированы, перемешаем элементы, используя функцию permutation.
-# Сохраним наш "зашафленный" DataFrame в единый файл, чтобы не терять время на сбор всех файлов в подкаталоге.
-import numpy as np
-np.random.seed(0)
-df=df.reindex(np.random.permutation(df.index))
-df.to_csv('./data/movie_data.csv', index=False)
+df = ingest_imdb('./data/aclImdb', './data/movie_data.csv', index=True)
 
 df=pd.read_csv('./data/movie_data.csv')
 df.head(3)
@@ -33,3 +33,51 @@ c.execute("SELECT * FROM review_db WHERE date BETWEEN '2015-01-01 00:00:00' AND
 results = c.fetchall()
 conn.close()
 print(results)
+
+# -=-=-=-=-=-=-= Хранилище отзывов для большого потока обратной связи -=-=-=-=-=-=-=
+# Выше на каждую операцию открывается новое соединение, а каждая строка вставляется и фиксируется отдельно, поэтому
+# тысячи отзывов в секунду такой код не выдерживает. ReviewStore включает режим WAL, держит пул соединений,
+# вставляет пакеты строк одним executemany в одной транзакции, создает индекс по date и читает результаты потоком.
+from movieclassifier.storage import ReviewStore
+store = ReviewStore('reviews.sqlite', pool_size=4)
+store.insert_many([(example1, 1), (example2, 0)])
+for review, sentiment, date in store.iter_between('2015-01-01 00:00:00', '2100-01-01 00:00:00', arraysize=1000):
+    print(date, sentiment, review)
+store.close()
+
+# -=-=-=-=-=-=-= Дообучение классификатора на обратной связи из review_db -=-=-=-=-=-=-=
+# Отзывы пользователей накапливаются в review_db, и классификатор можно дообучать на них методом partial_fit без полного
+# переобучения. Updater читает только строки с rowid больше сохраненной отметки (pkl_objects/watermark.json), дообучает
+# копию модели и атомарно заменяет classifier.pkl; сервис (python -m movieclassifier.service) замечает новый файл
+# или получает сигнал SIGHUP и подменяет модель без остановки.
+# В фоне: python -m movieclassifier.updater --db reviews.sqlite --interval 60 --notify-pid <pid сервиса>
+from movieclassifier.updater import Updater
+store = ReviewStore('reviews.sqlite', pool_size=1)
+print('Учтено новых отзывов: %d' % Updater(store).update_once())
+store.close()
+
+# -=-=-=-=-=-=-= Отложенная запись обратной связи -=-=-=-=-=-=-=
+# Чтобы задержка записи на диск не попадала в обработку запроса, обработчик только ставит отзыв в очередь FeedbackWriter
+# (и дописывает его в небольшой журнал), а отдельный поток записывает накопленные отзывы пакетами в одной транзакции.
+# При штатной остановке очередь дописывается, после сбоя незаписанные отзывы восстанавливаются из журнала.
+from movieclassifier.feedback_queue import FeedbackWriter
+store = ReviewStore('reviews.sqlite')
+writer = FeedbackWriter(store, 'reviews.journal', max_batch=500, max_delay=0.5)
+writer.submit('I love this movie', 1)
+writer.submit('I disliked this movie', 0)
+writer.close()
+store.close()
+
+# -=-=-=-=-=-=-= Полнотекстовый поиск и архив старых отзывов -=-=-=-=-=-=-=
+# Индекс FTS5 находит отзывы по словам и фразам без просмотра всей таблицы; триггеры обновляют его при любой записи
+# в review_db. Отзывы старше 30 дней переносятся в сжатые файлы .npz по дням (review_archive/YYYY-MM-DD), поэтому
+# рабочий файл базы остается небольшим, а историю можно читать пакетами прямо в цикл partial_fit.
+# По расписанию: python -m movieclassifier.archive --db reviews.sqlite --archive-dir review_archive --days 30
+from movieclassifier.archive import archive_batches, compact
+store = ReviewStore('reviews.sqlite')
+store.enable_fts()
+print(store.search('love this movie', limit=10, phrase=True))
+print('Перенесено в архив: %d' % compact(store, 'review_archive', days=30))
+store.close()
+for X_train, y_train in archive_batches('review_archive', batch_size=1000):
+    print(len(X_train), 'архивных отзывов в пакете')
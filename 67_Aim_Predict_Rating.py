@@ -1,15 +1,15 @@
 # Aim: Predict Rating from Review using basic and deep models
 
-import re
 import nltk
 
 import pandas as pd
 import numpy as np
 
-from bs4 import BeautifulSoup
 from nltk.corpus import stopwords
 from nltk.stem.porter import PorterStemmer
-english_stemmer=nltk.stem.SnowballStemmer('english')
+from textprep.stemming import MemoStemmer
+# memoized stemmer: each distinct word is stemmed only once
+english_stemmer=MemoStemmer(nltk.stem.SnowballStemmer('english'))
 
 from sklearn.feature_selection.univariate_selection import SelectKBest, chi2, f_classif
 from sklearn.model_selection import train_test_split
@@ -18,7 +18,6 @@ from sklearn.linear_model import SGDClassifier, SGDRegressor
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-import random
 import itertools
 
 import sys
@@ -55,50 +54,22 @@ from matplotlib import cm
 plt.style.use('ggplot')
 
 # Preprocessing Function
-# Here is the process :
+# Here is the process (textprep.cleaning.ReviewCleaner):
 #
+# Remove HTML tags
 # Remove the non Letters
 # Convert everything to lower case
 # Remove stop words
 # Stem the words
 
-def review_to_wordlist( review, remove_stopwords=True):
-    # Function to convert a document to a sequence of words,
-    # optionally removing stop words.  Returns a list of words.
-
-    # 1. Remove HTML
-    review_text = BeautifulSoup(review).get_text()
-
-
-    # 2. Remove non-letters
-    review_text = re.sub("[^a-zA-Z]"," ", review)
-
-    # 3. Convert words to lower case and split them
-    words = review_text.lower().split()
-
-    # 4. Optionally remove stop words (True by default)
-    if remove_stopwords:
-        stops = set(stopwords.words("english"))
-        words = [w for w in words if not w in stops]
-
-    b=[]
-    stemmer = english_stemmer #PorterStemmer()
-    for word in words:
-        b.append(stemmer.stem(word))
-
-    # 5. Return a list of words
-    return(b)
-
 # Import Datas
 # We import only 20000 lines of our total data in order to run the notebook faster
 data_file = '/Users/grigorev-ee/Work/AnacondaProjects/My_projects/ml_w_python/data/Amazon_Unlocked_Mobile.csv'
 
-n = 413000
-s = 20000
-skip = sorted(random.sample(range(1,n),n-s))
-
-
-data = pd.read_csv( data_file, delimiter = ",", skiprows = skip)
+# One streaming pass keeps a uniform random sample of 20000 rows, stratified by Rating; the total row count is not needed.
+# Later samples can use the cached row-offset index: sample_indexed(data_file, 20000)
+from textprep.sampling import sample_csv
+data = sample_csv(data_file, n=20000, stratify='Rating', delimiter=",")
 data.shape
 
 data = data[data['Reviews'].isnull()==False]
@@ -108,13 +79,16 @@ train, test = train_test_split(data, test_size = 0.3)
 sns.countplot(data['Rating'])
 
 # Apply Preprocessing
-clean_train_reviews = []
-for review in train['Reviews']:
-    clean_train_reviews.append( " ".join(review_to_wordlist(review)))
-
-clean_test_reviews = []
-for review in test['Reviews']:
-    clean_test_reviews.append( " ".join(review_to_wordlist(review)))
+# Reviews are cleaned in chunks on a process pool; results come back in the original order.
+# One regex pass strips HTML tags and extracts words, the stopword set is built once, and stemming goes through the
+# memoized english_stemmer. Benchmark against the old per-review function (textprep.cleaning.review_to_wordlist):
+# python -m textprep.cleaning Amazon_Unlocked_Mobile.csv --n 5000
+from textprep.parallel import imap_texts
+from textprep.cleaning import ReviewCleaner
+cleaner = ReviewCleaner(stopwords.words("english"), english_stemmer)
+clean_train_reviews = list(imap_texts(cleaner, train['Reviews'], chunk_size=500))
+
+clean_test_reviews = list(imap_texts(cleaner, test['Reviews'], chunk_size=500))
 
 # TFidf transformation
 
@@ -0,0 +1 @@
+# Каталог веб-приложения классификатора киноотзывов и вспомогательные модули для обучения вне ядра и обслуживания модели.
@@ -0,0 +1,297 @@
+# Асинхронный (asyncio) HTTP-сервис прогнозирования мнений.
+# Flask-приложение из 30_flask.py синхронное: на каждый запрос занят отдельный поток, а векторизация и predict_proba
+# выполняются в том же процессе под GIL. Здесь один цикл событий принимает все соединения, запросы собираются
+# в мини-пакеты (как в MicroBatcher из service.py), и каждый пакет vect.transform + predict_proba отправляется
+# в пул процессов, так что прогнозы считаются параллельно на нескольких ядрах. Запись обратной связи в reviews.sqlite
+# (POST /feedback) выполняется в пуле потоков и никогда не блокирует цикл событий.
+#
+# Процессы пула сами загружают модель и перечитывают ее, когда файл модели заменен (например, фоновым updater.py).
+#
+# Запуск:    python -m movieclassifier.aio_service --port 8000 --workers 4
+# Сравнение с многопоточным Flask при 1, 10 и 100 клиентах: python -m movieclassifier.aio_service --benchmark
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .service import load_classifier, model_stamp, predict_batch
+from .storage import ReviewStore
+from .vectorizer import cur_dir
+
+DEFAULT_MODEL = os.path.join(cur_dir, 'pkl_objects', 'classifier.pkl')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+# Модель в процессе пула: путь, версия файла и сам классификатор
+_model = {}
+
+
+def _init_worker(path):
+    _model['path'] = path
+    _model['stamp'] = model_stamp(path)
+    _model['clf'] = load_classifier(path)
+
+
+# Выполняется в процессе пула: прогноз для пакета отзывов, при замене файла модель загружается заново
+def _predict(texts):
+    try:
+        stamp = model_stamp(_model['path'])
+        if stamp != _model['stamp']:
+            _model['clf'] = load_classifier(_model['path'])
+            _model['stamp'] = stamp
+    except Exception as e:
+        # недописанный или поврежденный файл: продолжаем со старой моделью
+        print('Не удалось загрузить модель %s: %r' % (_model['path'], e))
+    return predict_batch(_model['clf'], texts)
+
+
+class AsyncBatcher(object):
+    # Собирает отзывы в пакеты до max_batch штук или max_wait_ms после первого отзыва пакета;
+    # одновременно в пуле обрабатывается не больше max_inflight пакетов, остальные ждут в очереди.
+    # Если пул свободен, ждать нет смысла: пакет из уже пришедших отзывов отправляется сразу.
+    def __init__(self, executor, max_batch=256, max_wait_ms=5, max_inflight=4):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self._busy = 0
+        self._queue = asyncio.Queue()
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def predict(self, text):
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + (self.max_wait if self._busy else 0)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            while len(batch) < self.max_batch and loop.time() < deadline:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), max(deadline - loop.time(), 0)))
+                except asyncio.TimeoutError:
+                    break
+            await self._inflight.acquire()
+            self._busy += 1
+            asyncio.ensure_future(self._process(batch))
+
+    # Прогноз пакета; если он не удался, каждый отзыв прогнозируется отдельно, чтобы ошибка одного запроса
+    # не затронула остальные
+    async def _predict_texts(self, texts):
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(self.executor, _predict, texts)
+        except Exception as e:
+            if len(texts) == 1:
+                return [e]
+        return [(await self._predict_texts([text]))[0] for text in texts]
+
+    async def _process(self, batch):
+        try:
+            results = await self._predict_texts([text for text, _ in batch])
+        finally:
+            self._busy -= 1
+            self._inflight.release()
+        self.batches += 1
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        self._task.cancel()
+
+
+class AsyncPredictServer(object):
+    # Минимальный сервер HTTP/1.1 с постоянными соединениями: POST /predict, POST /feedback, GET /stats
+    def __init__(self, batcher, store=None, io_executor=None):
+        self.batcher = batcher
+        self.store = store
+        self.io_executor = io_executor
+        self.feedback = 0
+
+    async def handle(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path = request_line.decode('latin-1').split()[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, obj = await self.dispatch(method, path, body)
+                except Exception as e:
+                    status, obj = 500, {'error': repr(e)}
+                payload = json.dumps(obj).encode('utf-8')
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                              % (status, REASONS[status], len(payload))).encode('latin-1') + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        if method == 'GET' and path == '/stats':
+            return 200, {'batches': self.batcher.batches, 'feedback': self.feedback}
+        if method != 'POST' or path not in ('/predict', '/feedback'):
+            return 404, {'error': 'not found'}
+        try:
+            request = json.loads(body.decode('utf-8'))
+            review = request['review']
+            if not isinstance(review, str):
+                raise TypeError(review)
+            if path == '/feedback':
+                sentiment = int(request['sentiment'])
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': 'Ожидается JSON вида {"review": "..."} (для /feedback еще "sentiment": 0 или 1)'}
+        if path == '/predict':
+            prediction, probability = await self.batcher.predict(review)
+            return 200, {'prediction': prediction, 'probability': probability}
+        if self.store is None:
+            return 404, {'error': 'база отзывов не задана'}
+        await asyncio.get_event_loop().run_in_executor(self.io_executor, self.store.insert, review, sentiment)
+        self.feedback += 1
+        return 200, {'stored': True}
+
+
+async def serve(path, host='127.0.0.1', port=8000, workers=None, max_batch=256, max_wait_ms=5, db=None):
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path,))
+    io_executor = ThreadPoolExecutor(4)
+    store = ReviewStore(db) if db else None
+    batcher = AsyncBatcher(executor, max_batch, max_wait_ms, max_inflight=workers)
+    app = AsyncPredictServer(batcher, store, io_executor)
+    server = await asyncio.start_server(app.handle, host, port, backlog=1024)
+    # по SIGTERM и SIGINT сервис останавливается штатно, иначе процессы пула пережили бы его
+    # вместе с унаследованным слушающим сокетом
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_event_loop().add_signal_handler(signum, stop.set)
+    print('Асинхронный сервис запущен на http://%s:%d/predict (pid %d)' % (host, port, os.getpid()))
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        batcher.close()
+        executor.shutdown()
+        io_executor.shutdown()
+        if store is not None:
+            store.close()
+
+
+# Базовый вариант для сравнения: Flask в многопоточном режиме, по одному отзыву на запрос, как в 30_flask.py
+def make_flask_app(path, db=None):
+    from flask import Flask, jsonify, request
+
+    app = Flask(__name__)
+    clf = load_classifier(path)
+    store = ReviewStore(db) if db else None
+
+    @app.route('/predict', methods=['POST'])
+    def predict():
+        prediction, probability = predict_batch(clf, [request.get_json(force=True)['review']])[0]
+        return jsonify(prediction=prediction, probability=probability)
+
+    @app.route('/feedback', methods=['POST'])
+    def feedback():
+        body = request.get_json(force=True)
+        store.insert(body['review'], int(body['sentiment']))
+        return jsonify(stored=True)
+
+    return app
+
+
+def _wait_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Сервер на %s:%d не запустился' % (host, port))
+
+
+# Запускает каждый сервер в отдельном процессе и прогоняет loadtest.run при заданном числе клиентов
+def benchmark(path, concurrency=(1, 10, 100), requests=2000, reviews=None, workers=None, port=8765):
+    from .loadtest import EXAMPLES, run
+
+    results = []
+    for kind in ('flask', 'asyncio'):
+        cmd = [sys.executable, '-m', 'movieclassifier.aio_service', '--classifier', path, '--port', str(port)]
+        cmd += ['--flask'] if kind == 'flask' else ['--workers', str(workers or os.cpu_count() or 1)]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(cur_dir))] + sys.path))
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_port('127.0.0.1', port)
+            url = 'http://127.0.0.1:%d/predict' % port
+            run(url, 1, 50, reviews or EXAMPLES)  # прогрев
+            for n in concurrency:
+                result = run(url, n, requests, reviews or EXAMPLES)
+                result['server'] = kind
+                results.append(result)
+                print(json.dumps(result))
+        finally:
+            proc.terminate()
+            proc.wait()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Асинхронный HTTP-сервис прогнозирования мнений')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--classifier', default=DEFAULT_MODEL, help='путь к classifier.pkl или каталогу модели .npy')
+    parser.add_argument('--workers', type=int, default=None, help='число процессов для прогнозов')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--db', default=None, help='reviews.sqlite для POST /feedback')
+    parser.add_argument('--flask', action='store_true', help='запустить многопоточный Flask для сравнения')
+    parser.add_argument('--benchmark', action='store_true', help='сравнить asyncio и Flask при 1, 10 и 100 клиентах')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--reviews', default=None, help='CSV с отзывами для нагрузочного теста')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        reviews = None
+        if args.reviews is not None:
+            from .stream_reader import stream_batches
+            reviews = next(stream_batches(args.reviews, batch_size=1000))[0]
+        benchmark(args.classifier, args.concurrency, args.requests, reviews, args.workers, args.port)
+    elif args.flask:
+        make_flask_app(args.classifier, args.db).run(args.host, args.port, threaded=True)
+    else:
+        asyncio.run(serve(args.classifier, args.host, args.port, args.workers, args.max_batch, args.max_wait_ms,
+                          args.db))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# Архив старых отзывов review_db в сжатых столбцовых файлах .npz с разбиением по дням.
+# review_db растет без ограничений, и любой аналитический запрос просматривает всю таблицу. compact переносит строки
+# старше days дней в файлы archive_dir/YYYY-MM-DD/part-<первый rowid>-<последний rowid>.npz и удаляет их из базы.
+# Освободившиеся страницы SQLite использует под новые строки, поэтому рабочий файл перестает расти. VACUUM
+# не выполняется: он может перенумеровать rowid, а на них опираются отметка updater.py и индекс FTS5.
+# По той же причине строка с наибольшим rowid никогда не удаляется: в review_db нет AUTOINCREMENT, и без нее новые
+# строки получили бы rowid уже учтенных, которые updater.py пропустил бы как старые.
+#
+# Столбцы файла: text - тексты отзывов подряд в UTF-8 (uint8) и offsets - границы отзывов в нем, sentiment (int8),
+# rowid (int64) и date (S19). Файл сначала пишется целиком во временный, затем переименовывается, и только после
+# этого строки удаляются из базы. Если работа прервется между этими шагами, повторный запуск выберет те же строки
+# и перезапишет тот же файл.
+#
+# archive_batches читает архив пакетами (texts, labels), как stream_batches, поэтому историю можно передавать
+# прямо в цикл partial_fit.
+#
+# python -m movieclassifier.archive --db reviews.sqlite --archive-dir review_archive --days 30
+import argparse
+import datetime
+import os
+
+import numpy as np
+
+from .storage import ReviewStore
+
+
+# Сохраняет тексты столбцами text/offsets вместе с остальными столбцами columns (массивы той же длины).
+# Файл сначала пишется во временный, затем переименовывается.
+def save_columns(path, texts, compress=True, **columns):
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    tmp = path + '.tmp.npz'
+    (np.savez_compressed if compress else np.savez)(tmp, text=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                                                    offsets=offsets, **columns)
+    os.replace(tmp, path)
+
+
+# Тексты из столбцов text/offsets и словарь остальных столбцов
+def load_columns(path):
+    with np.load(path) as data:
+        text = data['text'].tobytes()
+        offsets = data['offsets']
+        texts = [text[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+        return texts, dict((name, data[name]) for name in data.files if name not in ('text', 'offsets'))
+
+
+def _write_partition(path, rows):
+    save_columns(path, [row[1] for row in rows],
+                 sentiment=np.array([row[2] for row in rows], dtype=np.int8),
+                 rowid=np.array([row[0] for row in rows], dtype=np.int64),
+                 date=np.array([row[3].encode('ascii') for row in rows], dtype='S19'))
+
+
+# Переносит в архив строки с датой раньше now - days (время в UTC, как у DATETIME('now')); возвращает их число
+def compact(store, archive_dir, days=30, now=None, batch_size=50000):
+    now = now or datetime.datetime.utcnow()
+    cutoff = (now - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    total = 0
+    while True:
+        with store.connection() as conn:
+            rows = conn.execute('SELECT rowid, review, sentiment, date FROM review_db WHERE date < ? '
+                                'AND rowid < (SELECT MAX(rowid) FROM review_db) '
+                                'ORDER BY date, rowid LIMIT ?', (cutoff, batch_size)).fetchall()
+        if not rows:
+            return total
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(row[3][:10], []).append(row)
+        for day, part in sorted(partitions.items()):
+            day_dir = os.path.join(archive_dir, day)
+            if not os.path.exists(day_dir):
+                os.makedirs(day_dir)
+            _write_partition(os.path.join(day_dir, 'part-%d-%d.npz' % (part[0][0], part[-1][0])), part)
+        with store.transaction() as conn:
+            conn.executemany('DELETE FROM review_db WHERE rowid = ?', [(row[0],) for row in rows])
+        total += len(rows)
+
+
+# Файлы архива за дни из [start, end] (строки 'YYYY-MM-DD', None - без ограничения) в хронологическом порядке
+def partitions(archive_dir, start=None, end=None):
+    if not os.path.isdir(archive_dir):
+        return []
+    paths = []
+    for day in sorted(os.listdir(archive_dir)):
+        if (start is not None and day < start) or (end is not None and day > end):
+            continue
+        day_dir = os.path.join(archive_dir, day)
+        paths += [os.path.join(day_dir, name) for name in sorted(os.listdir(day_dir), key=_part_key)
+                  if name.endswith('.npz') and not name.endswith('.tmp.npz')]
+    return paths
+
+
+def _part_key(name):
+    return int(name.split('-')[1]) if name.startswith('part-') else 0
+
+
+# Столбцы одного файла: тексты отзывов (list), метки, rowid и даты
+def read_partition(path):
+    texts, columns = load_columns(path)
+    return texts, columns['sentiment'].astype(int), columns['rowid'], columns['date']
+
+
+# Пакеты (texts, labels) по batch_size отзывов из архива за период [start, end]
+def archive_batches(archive_dir, batch_size=1000, start=None, end=None):
+    texts, labels = [], []
+    for path in partitions(archive_dir, start, end):
+        part_texts, part_labels, _, _ = read_partition(path)
+        texts += part_texts
+        labels += part_labels.tolist()
+        while len(texts) >= batch_size:
+            yield texts[:batch_size], labels[:batch_size]
+            texts, labels = texts[batch_size:], labels[batch_size:]
+    if texts:
+        yield texts, labels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Перенос старых отзывов из review_db в архив .npz и поиск FTS5')
+    parser.add_argument('--db', default='reviews.sqlite')
+    parser.add_argument('--archive-dir', default='review_archive')
+    parser.add_argument('--days', type=float, default=30, help='переносить отзывы старше стольких дней')
+    parser.add_argument('--enable-fts', action='store_true', help='создать полнотекстовый индекс FTS5')
+    parser.add_argument('--search', default=None, help='найти отзывы с этой фразой (нужен индекс FTS5)')
+    args = parser.parse_args(argv)
+
+    with ReviewStore(args.db, pool_size=1) as store:
+        if args.enable_fts:
+            store.enable_fts()
+        if args.search is not None:
+            for rowid, review, sentiment, date in store.search(args.search, phrase=True):
+                print(rowid, date, sentiment, review)
+        else:
+            n = compact(store, args.archive_dir, args.days)
+            print('Перенесено в архив: %d отзывов, осталось в базе: %d' % (n, store.count()))
+
+
+if __name__ == '__main__':
+    main()
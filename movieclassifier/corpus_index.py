@@ -0,0 +1,128 @@
+# Индекс смещений строк для movie_data.csv и чтение документов в произвольном порядке.
+# stream_docs читает файл только от начала к концу, поэтому каждая эпоха видит документы в одном и том же порядке,
+# а тестовую выборку можно взять только из хвоста файла. Здесь один раз строится индекс - массив NumPy байтовых смещений
+# начала каждой записи (и метки классов для стратификации), - который сохраняется рядом с файлом. Сам файл отображается
+# в память (mmap), и любой документ читается по смещению без повторного сканирования.
+import csv
+import io
+import mmap
+import os
+
+import numpy as np
+
+
+def index_path(path):
+    return path + '.idx.npz'
+
+
+# Размер и время изменения файла (в наносекундах): по ним проверяем, что индекс построен для текущей версии файла.
+# Одного размера мало: перемешанный заново тот же корпус (например, ingest с другим seed) имеет тот же размер.
+def file_signature(path):
+    st = os.stat(path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+# Один проход по файлу: для каждой записи CSV (после заголовка) возвращает смещение ее начала и последнюю строку.
+# Запись заканчивается на той строке, где число кавычек с начала записи четное, поэтому отзывы в кавычках с переводами
+# строк внутри разбираются верно. В конце возвращается (размер файла, None).
+def iter_records(path):
+    with open(path, 'rb') as f:
+        pos = len(f.readline())  # пропускаем заголовок
+        start, quotes = pos, 0
+        for line in f:
+            pos += len(line)
+            quotes += line.count(b'"')
+            if quotes % 2:
+                continue
+            yield start, line
+            start, quotes = pos, 0
+    yield pos, None
+
+
+# Смещения начала записей и метки из последнего столбца (последний элемент offsets - размер файла).
+# Вместе с ними сохраняется file_signature, по которой проверяем, что индекс не устарел.
+def build_index(path):
+    signature = file_signature(path)
+    offsets, labels = [], []
+    for start, line in iter_records(path):
+        offsets.append(start)
+        if line is not None:
+            labels.append(int(line.rstrip(b'\r\n').rsplit(b',', 1)[1]))
+    offsets = np.array(offsets, dtype=np.int64)
+    labels = np.array(labels, dtype=np.int8)
+    np.savez(index_path(path), offsets=offsets, labels=labels, signature=signature)
+    return offsets, labels
+
+
+# Загружает сохраненный индекс или строит его заново, если индекса нет или файл изменился
+def load_index(path, rebuild=False):
+    idx = index_path(path)
+    if not rebuild and os.path.exists(idx):
+        with np.load(idx) as data:
+            # индекс прежнего формата без signature строится заново
+            if 'signature' in data.files and np.array_equal(data['signature'], file_signature(path)):
+                return data['offsets'], data['labels']
+    return build_index(path)
+
+
+class CorpusReader(object):
+    def __init__(self, path, rebuild_index=False):
+        self.path = path
+        self.offsets, self.labels = load_index(path, rebuild=rebuild_index)
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.labels)
+
+    # Возвращает кортеж (текст, метка) документа с номером i
+    def __getitem__(self, i):
+        raw = self._mm[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+        text, label = next(csv.reader(io.StringIO(raw)))
+        return text, int(label)
+
+    # Аналог get_minibatch для произвольного набора номеров документов
+    def get_minibatch(self, indices):
+        docs, y = [], []
+        for i in indices:
+            text, label = self[i]
+            docs.append(text)
+            y.append(label)
+        return docs, y
+
+    # Мини-пакеты в порядке indices (по умолчанию все документы), при заданном seed - в случайном порядке.
+    # Для нескольких эпох достаточно вызывать с разными seed.
+    def iter_minibatches(self, size, indices=None, seed=None):
+        if indices is None:
+            indices = np.arange(len(self))
+        if seed is not None:
+            indices = np.random.RandomState(seed).permutation(indices)
+        for start in range(0, len(indices), size):
+            yield self.get_minibatch(indices[start:start + size])
+
+    # Стратифицированная выборка n номеров документов: доли классов те же, что и во всем корпусе
+    def stratified_sample(self, n, seed=None):
+        rng = np.random.RandomState(seed)
+        classes, counts = np.unique(self.labels, return_counts=True)
+        sizes = np.floor(counts * n / float(len(self))).astype(int)
+        # остаток от округления раздаем самым крупным классам
+        sizes[np.argsort(-counts)[:n - sizes.sum()]] += 1
+        sample = [rng.choice(np.flatnonzero(self.labels == c), k, replace=False) for c, k in zip(classes, sizes)]
+        return rng.permutation(np.concatenate(sample))
+
+    # Стратифицированное разбиение на тренировочные и тестовые номера документов
+    def train_test_split(self, test_size, seed=None):
+        test = self.stratified_sample(test_size, seed=seed)
+        mask = np.ones(len(self), dtype=bool)
+        mask[test] = False
+        return np.flatnonzero(mask), test
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,122 @@
+# Кэш хэшированных признаков на диске для повторных эпох.
+# HashingVectorizer не требует подгонки, поэтому лексемизация и хэширование одного и того же текста всегда дают одну и ту же
+# CSR-матрицу. При первом проходе каждый мини-пакет сохраняется в отдельный блок (shard): массивы data, indices, indptr
+# CSR-матрицы и метки y в формате .npy. В следующих эпохах и при оценке на тестовой выборке блоки отображаются в память
+# (np.load(mmap_mode='r')) и сразу передаются в partial_fit.
+# Ключ кэша - хэш конфигурации векторизатора, контрольной суммы исходного файла, параметров разбиения на мини-пакеты
+# и состава потока (номера документов в порядке подачи или идентификатор потока, заданный вызывающим кодом),
+# поэтому устаревшие блоки никогда не используются повторно: при любом изменении получается новый каталог.
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+# Контрольная сумма SHA-1 содержимого файла, читаем блоками по 1 Мб
+def file_checksum(path, chunk_size=2**20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# Хэш текста функции (или ее байт-кода, если исходник недоступен), чтобы правка tokenizer в скрипте меняла ключ кэша.
+# Глобальные переменные и объекты, которые функция вызывает, в хэш не входят - при их изменении кэш нужно очистить.
+def _code_digest(func):
+    try:
+        source = inspect.getsource(func).encode('utf-8')
+    except (OSError, TypeError):
+        code = getattr(func, '__code__', None)
+        source = code.co_code + repr(code.co_consts).encode('utf-8') if code is not None else b''
+    return hashlib.sha1(source).hexdigest()[:12]
+
+
+# Описание параметра векторизатора без адресов в памяти: функции описываются полным именем и хэшем кода
+def _describe(value):
+    if callable(value) and hasattr(value, '__qualname__'):
+        return '%s.%s#%s' % (value.__module__, value.__qualname__, _code_digest(value))
+    return repr(value)
+
+
+# Хэш номеров документов в порядке подачи: другое разбиение на обучающую и тестовую выборки дает другой ключ
+def indices_digest(indices):
+    return hashlib.sha1(np.ascontiguousarray(indices, dtype=np.int64).tobytes()).hexdigest()
+
+
+def vectorizer_config(vect):
+    params = vect.get_params()
+    return '%s(%s)' % (type(vect).__name__, ', '.join('%s=%s' % (k, _describe(params[k])) for k in sorted(params)))
+
+
+class FeatureCache(object):
+    # name различает разные потоки мини-пакетов одного файла (например, 'train' и 'test'),
+    # batch_size входит в ключ, т.к. от него зависит разбиение на блоки.
+    # indices - номера документов потока в порядке подачи (например, из CorpusReader.train_test_split), stream_id - любая
+    # строка, однозначно описывающая поток, если номеров нет; без них считается, что поток - весь файл по порядку.
+    def __init__(self, cache_dir, vect, source_path, name='train', batch_size=1000, checksum=None, indices=None,
+                 stream_id=None):
+        self.vect = vect
+        self.batch_size = batch_size
+        if checksum is None:
+            checksum = file_checksum(source_path)
+        stream = [] if indices is None else ['indices=' + indices_digest(indices)]
+        if stream_id is not None:
+            stream.append('stream=%s' % stream_id)
+        key = '\n'.join([vectorizer_config(vect), checksum, name, str(batch_size)] + stream)
+        self.key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        self.path = os.path.join(cache_dir, '%s-%s' % (name, self.key[:16]))
+
+    # Кэш готов, если записан manifest.json - он создается последним
+    def is_complete(self):
+        return os.path.exists(os.path.join(self.path, 'manifest.json'))
+
+    def _shard(self, path, i, part):
+        return os.path.join(path, '%05d.%s.npy' % (i, part))
+
+    # Читает готовые блоки, возвращает пары (X, y) на отображенных в память массивах
+    def read(self):
+        with open(os.path.join(self.path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        for i, n_rows in enumerate(manifest['rows']):
+            data, indices, indptr, y = [np.load(self._shard(self.path, i, part), mmap_mode='r')
+                                        for part in ('data', 'indices', 'indptr', 'y')]
+            X = csr_matrix((data, indices, indptr), shape=(n_rows, manifest['n_features']), copy=False)
+            yield X, y
+
+    # Векторизует мини-пакеты (docs, y), сохраняет их блоками и сразу возвращает пары (X, y), поэтому первая эпоха
+    # обучается параллельно с заполнением кэша. Блоки пишутся во временный каталог, который переименовывается только после
+    # записи всех блоков; прерванная запись удаляется.
+    def write(self, batches):
+        tmp = '%s.tmp-%d' % (self.path, os.getpid())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        rows = []
+        try:
+            for i, (docs, y) in enumerate(batches):
+                X = self.vect.transform(docs).tocsr()
+                y = np.asarray(y)
+                for part, arr in (('data', X.data), ('indices', X.indices), ('indptr', X.indptr), ('y', y)):
+                    np.save(self._shard(tmp, i, part), arr)
+                rows.append(X.shape[0])
+                yield X, y
+            with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+                json.dump({'rows': rows, 'n_features': self.vect.n_features}, f)
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path)
+            os.rename(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+
+    # Один проход по данным: из кэша, если он готов, иначе через batches с заполнением кэша.
+    # batches - функция без аргументов, возвращающая поток мини-пакетов (вызывается только при промахе кэша).
+    def iter_epoch(self, batches):
+        if self.is_complete():
+            return self.read()
+        return self.write(batches())
@@ -0,0 +1,200 @@
+# Отложенная запись обратной связи в review_db (write-behind).
+# Синхронная вставка каждого отзыва, как в 29_sqlite.py, добавляет задержку записи на диск к каждому запросу.
+# FeedbackWriter принимает кортежи (review, sentiment, date) в очередь, а отдельный поток записывает их пакетами в одной
+# транзакции, когда набралось max_batch записей или прошло max_delay секунд с первой записи пакета.
+# Каждая запись сначала дописывается в журнал (JSON lines) с порядковым номером, а номер последней записанной
+# в базу записи сохраняется в той же транзакции, что и сами отзывы. Поэтому после аварийного перезапуска из журнала
+# повторно ставятся в очередь ровно те записи, которые не попали в базу. При штатной остановке очередь дописывается
+# полностью, а журнал очищается.
+#
+# Журнал делится на сегменты: когда текущий файл становится больше max_journal_bytes, он закрывается и переименовывается
+# в <journal>.<номер последней записи>, а запись продолжается в новый файл. Закрытый сегмент удаляется, как только все
+# его записи оказались в базе, поэтому размер журнала ограничен и при постоянной нагрузке, когда очередь не пустеет.
+#
+# Запись, которую база не принимает (sqlite3.ProgrammingError или InterfaceError - ошибка в самих данных, а не
+# недоступность базы), не повторяется бесконечно: она переносится в файл <journal>.dead вместе с текстом ошибки,
+# а остальные записи пакета записываются в базу по одной.
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+STATE_SCHEMA = 'CREATE TABLE IF NOT EXISTS feedback_journal_state (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER)'
+
+# ошибки в данных записи: повторная попытка дала бы тот же результат
+NON_TRANSIENT = (sqlite3.ProgrammingError, sqlite3.InterfaceError)
+
+
+def _now():
+    # тот же формат, что у DATETIME('now') в SQLite (UTC)
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+class FeedbackWriter(object):
+    # store - ReviewStore, journal_path - файл журнала, max_journal_bytes - размер сегмента журнала,
+    # fsync - сбрасывать ли журнал на диск после каждой записи
+    def __init__(self, store, journal_path, max_batch=500, max_delay=0.5, max_journal_bytes=2**22, fsync=False):
+        self.store = store
+        self.journal_path = journal_path
+        self.dead_letter_path = journal_path + '.dead'
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_journal_bytes = max_journal_bytes
+        self.fsync = fsync
+        self.flushed = 0
+        self.dead = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        with store.connection() as conn:
+            conn.execute(STATE_SCHEMA)
+        self._flushed_seq = self._db_seq()
+        self._seq = self._flushed_seq
+        self._segments = self._sealed_segments()
+        self.recovered = self._recover()
+        self._journal = open(journal_path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name='feedback-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _db_seq(self):
+        with self.store.connection() as conn:
+            row = conn.execute('SELECT seq FROM feedback_journal_state WHERE id = 0').fetchone()
+        return row[0] if row else 0
+
+    # Закрытые сегменты журнала: список пар (номер последней записи, путь) по возрастанию номеров
+    def _sealed_segments(self):
+        directory, base = os.path.split(os.path.abspath(self.journal_path))
+        segments = []
+        for name in os.listdir(directory):
+            suffix = name[len(base) + 1:]
+            if name.startswith(base + '.') and suffix.isdigit():
+                segments.append((int(suffix), os.path.join(directory, name)))
+        return sorted(segments)
+
+    # Записи журнала с номером больше сохраненного в базе возвращаются в очередь
+    def _recover(self):
+        n = 0
+        paths = [path for _, path in self._segments]
+        if os.path.exists(self.journal_path):
+            paths.append(self.journal_path)
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        seq, review, sentiment, date = json.loads(line)
+                    except ValueError:
+                        break  # недописанная последняя строка после сбоя
+                    if seq > self._flushed_seq:
+                        self._queue.put((seq, review, sentiment, date))
+                        n += 1
+                    self._seq = max(self._seq, seq)
+        return n
+
+    # Вызывается из обработчиков запросов: возвращается сразу после записи в журнал.
+    # Неверные типы отклоняются здесь, чтобы такая запись не попала в журнал.
+    def submit(self, review, sentiment, date=None):
+        if not isinstance(review, str):
+            raise TypeError('review должен быть строкой, а не %s' % type(review).__name__)
+        if date is not None and not isinstance(date, str):
+            raise TypeError('date должна быть строкой, а не %s' % type(date).__name__)
+        sentiment = int(sentiment)
+        with self._lock:
+            self._seq += 1
+            item = (self._seq, review, sentiment, date or _now())
+            self._journal.write(json.dumps(item) + '\n')
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._queue.put(item)
+            if self._journal.tell() > self.max_journal_bytes:
+                self._seal()
+
+    # Закрывает текущий сегмент журнала и начинает новый; вызывается под self._lock
+    def _seal(self):
+        self._journal.close()
+        path = '%s.%d' % (self.journal_path, self._seq)
+        os.rename(self.journal_path, path)
+        self._segments.append((self._seq, path))
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._drop_segments()
+
+    # Удаляет сегменты, все записи которых уже в базе; вызывается под self._lock
+    def _drop_segments(self):
+        while self._segments and self._segments[0][0] <= self._flushed_seq:
+            os.remove(self._segments.pop(0)[1])
+
+    def _flush(self, batch):
+        with self.store.transaction() as conn:
+            conn.executemany('INSERT INTO review_db (review, sentiment, date) VALUES (?, ?, ?)',
+                             [item[1:] for item in batch])
+            conn.execute('INSERT OR REPLACE INTO feedback_journal_state (id, seq) VALUES (0, ?)', (batch[-1][0],))
+        self.flushed += len(batch)
+        self._mark_flushed(batch[-1][0])
+
+    def _mark_flushed(self, seq):
+        with self._lock:
+            self._flushed_seq = seq
+            self._drop_segments()
+
+    # Запись, которую база не принимает, сохраняется в <journal>.dead и отмечается как обработанная
+    def _dead_letter(self, item, error):
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(list(item) + [repr(error)]) + '\n')
+        with self.store.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO feedback_journal_state (id, seq) VALUES (0, ?)', (item[0],))
+        self.dead += 1
+        self._mark_flushed(item[0])
+        print('Отзыв %d перенесен в %s: %r' % (item[0], self.dead_letter_path, error))
+
+    # Записывает пакет; при ошибке в данных - по одной записи, чтобы отделить неверные
+    def _write(self, batch):
+        try:
+            self._flush(batch)
+            return
+        except NON_TRANSIENT as e:
+            if len(batch) == 1:
+                self._dead_letter(batch[0], e)
+                return
+        for item in batch:
+            self._write([item])
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            while batch:
+                try:
+                    self._write(batch)
+                    break
+                except Exception as e:
+                    # база недоступна: записи остаются в журнале, повторяем попытку для еще не записанных
+                    print('Не удалось записать %d отзывов: %r' % (len(batch), e))
+                    time.sleep(1.0)
+                    batch = [item for item in batch if item[0] > self._flushed_seq]
+
+    def pending(self):
+        return self._queue.qsize()
+
+    # Дописывает очередь в базу и очищает журнал
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            if self._flushed_seq == self._seq:
+                self._journal.truncate(0)
+            self._journal.close()
@@ -0,0 +1,71 @@
+# tf-idf вне ядра поверх HashingVectorizer.
+# TfidfVectorizer в 26_nlp_tf_idf.py требует держать в памяти весь корпус, чтобы построить словарь и idf, а обучение
+# вне ядра в 27_big_data_out_of_core.py использует хэшированные признаки вообще без idf. HashingTfidf за один проход
+# по мини-пакетам (например, stream_batches) считает документные частоты df для каждой хэш-ячейки - массив из
+# n_features счетчиков вместо словаря. Затем в цикле partial_fit каждый мини-пакет взвешивается: сублинейная частота
+# 1 + log(tf), множитель idf = log((1 + n) / (1 + df)) + 1 (как smooth_idf в TfidfVectorizer) и нормировка L2.
+# Объем памяти - как у хэширования, а качество признаков - как у tf-idf.
+import numpy as np
+from sklearn.base import clone
+from sklearn.preprocessing import normalize
+
+
+class HashingTfidf(object):
+    # vect - HashingVectorizer; для подсчета частот используется его копия с norm=None и alternate_sign=False
+    def __init__(self, vect, sublinear_tf=True, smooth_idf=True, norm='l2'):
+        self.vect = clone(vect).set_params(norm=None, alternate_sign=False)
+        self.sublinear_tf = sublinear_tf
+        self.smooth_idf = smooth_idf
+        self.norm = norm
+        self.n_docs = 0
+        self.df = np.zeros(self.vect.n_features, dtype=np.int64)
+        self._idf = None
+
+    # idf пересчитывается по df, поэтому при консервации (например, для VectorizingPool) его не сохраняем
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_idf'] = None
+        return state
+
+    # Учитывает документные частоты мини-пакета текстов
+    def partial_fit(self, docs):
+        self.count(self.vect.transform(docs))
+        return self
+
+    # То же для уже хэшированной матрицы частот (например, из FeatureCache с тем же векторизатором)
+    def count(self, X):
+        X = X.tocsr()
+        X.sum_duplicates()
+        self.df += np.bincount(X.indices, minlength=self.df.shape[0])
+        self.n_docs += X.shape[0]
+        self._idf = None
+
+    # Один проход по мини-пакетам (docs, y) или спискам текстов
+    def fit(self, batches):
+        for batch in batches:
+            self.partial_fit(batch[0] if isinstance(batch, tuple) else batch)
+        return self
+
+    @property
+    def idf_(self):
+        if self._idf is None:
+            smooth = int(self.smooth_idf)
+            self._idf = np.log((self.n_docs + smooth) / (self.df + smooth).astype(np.float64)) + 1
+            # ячейки, не встретившиеся ни в одном документе, при smooth_idf=False дают деление на ноль
+            self._idf[~np.isfinite(self._idf)] = 0.0
+        return self._idf
+
+    # Взвешивание матрицы частот: 1 + log(tf), idf и нормировка
+    def weight(self, X):
+        X = X.tocsr().astype(np.float64)
+        X.sum_duplicates()
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        X.data *= self.idf_[X.indices]
+        if self.norm is not None:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+    def transform(self, docs):
+        return self.weight(self.vect.transform(docs))
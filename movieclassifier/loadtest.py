@@ -0,0 +1,80 @@
+# Нагрузочное тестирование HTTP-сервиса прогнозирования мнений.
+# concurrency клиентов в отдельных потоках отправляют запросы POST /predict по постоянным соединениям, после чего
+# печатаются медиана (p50) и 99-й перцентиль (p99) задержки и число запросов в секунду.
+#
+# python -m movieclassifier.loadtest --url http://127.0.0.1:8000/predict --concurrency 32 --requests 5000
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+EXAMPLES = ['I love this movie', 'I disliked this movie', 'The plot was boring and the acting was awful',
+            'One of the best films I have ever seen :)']
+
+
+# Один клиент: отправляет n запросов подряд и записывает задержку каждого в latencies
+def _client(url, reviews, n, latencies, errors):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    for i in range(n):
+        body = json.dumps({'review': reviews[i % len(reviews)]})
+        start = time.perf_counter()
+        try:
+            conn.request('POST', parts.path, body, {'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(repr(e))
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+# Возвращает словарь с p50/p99 в миллисекундах, числом запросов в секунду и числом ошибок
+def run(url, concurrency=10, requests=1000, reviews=EXAMPLES):
+    latencies, errors = [], []
+    per_client = max(requests // concurrency, 1)
+    threads = [threading.Thread(target=_client, args=(url, reviews, per_client, latencies, errors))
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) * 1000
+    return {'concurrency': concurrency,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'p50_ms': round(float(np.percentile(lat, 50)), 2) if len(lat) else None,
+            'p99_ms': round(float(np.percentile(lat, 99)), 2) if len(lat) else None,
+            'rps': round(len(latencies) / elapsed, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест сервиса прогнозирования мнений')
+    parser.add_argument('--url', default='http://127.0.0.1:8000/predict')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--reviews', default=None, help='CSV с отзывами в первом столбце (например, movie_data.csv)')
+    args = parser.parse_args(argv)
+
+    reviews = EXAMPLES
+    if args.reviews is not None:
+        from .stream_reader import stream_batches
+        reviews = next(stream_batches(args.reviews, batch_size=1000))[0]
+    for concurrency in args.concurrency:
+        print(json.dumps(run(args.url, concurrency, args.requests, reviews)))
+
+
+if __name__ == '__main__':
+    main()
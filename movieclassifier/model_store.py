@@ -0,0 +1,286 @@
+# Хранение линейного классификатора в виде отдельных массивов .npy для быстрой ленивой загрузки.
+# classifier.pkl из pkl_objects при расконсервации целиком читает плотный массив coef_ шириной 2^21 (16 Мб float64)
+# в память каждого рабочего процесса. Здесь coef_, intercept_ и classes_ сохраняются как .npy, а параметры модели -
+# в небольшом манифесте manifest.json. Загрузчик отображает массивы в память (np.load(mmap_mode='r')), поэтому старт
+# почти мгновенный, а страницы файла в кэше ОС общие для всех процессов, которые загрузили одну и ту же модель.
+#
+# Разреженный формат (export_sparse): при HashingVectorizer(n_features=2**21) большинство весов нулевые или почти нулевые,
+# поэтому можно хранить только пары (номер признака int32, вес float32), при желании квантованные в int8 с общим для модели
+# масштабом (5 байт на вес вместо 8 у плотного float64), и отбрасывать веса по модулю не больше threshold. SparseLinearModel вычисляет прогноз прямо по хэшированным
+# строкам CSR, не восстанавливая плотный вектор весов.
+#
+# Преобразование законсервированной модели: python -m movieclassifier.model_store classifier.pkl classifier_npy
+# Разреженная квантованная модель:          python -m movieclassifier.model_store classifier.pkl classifier_q8 --sparse --quantize
+# Сравнение памяти, загрузки и верности:    python -m movieclassifier.model_store classifier.pkl --compare ./data/movie_data.csv
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.special import expit
+from sklearn.linear_model import SGDClassifier
+
+FORMAT = 'linear-npy'
+SPARSE_FORMAT = 'linear-sparse'
+VERSION = 1
+SPARSE_VERSION = 2
+ARRAYS = ('coef', 'intercept', 'classes')
+SPARSE_ARRAYS = ('indptr', 'indices', 'values', 'intercept', 'classes')
+
+
+def json_params(clf):
+    params = {}
+    for key, value in clf.get_params().items():
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        params[key] = value
+    return params
+
+
+def _write_manifest(dest, manifest):
+    tmp = os.path.join(dest, 'manifest.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(dest, 'manifest.json'))
+
+
+# Публикация новой версии модели. Массивы нельзя перезаписывать на месте: np.save обрезает тот же файл (inode), который
+# обслуживающие процессы отобразили в память, и они получают SIGBUS или видят смесь старых и новых весов. Поэтому
+# write(path) заполняет новый скрытый каталог-версию рядом с dest (.<имя>-XXXX), а dest - это символическая ссылка,
+# которая атомарно (os.replace) переключается на новую версию. Файлы старой версии удаляются, но уже отображенные
+# в память страницы остаются доступны процессам, пока те их не освободят. Каталог dest в прежнем формате (не ссылка)
+# сначала переносится в сторону, поэтому только при первой публикации путь на мгновение отсутствует.
+def _publish(dest, write):
+    parent, base = os.path.split(os.path.abspath(dest))
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    prefix = '.%s-' % base
+    version = tempfile.mkdtemp(prefix=prefix, dir=parent)
+    link = version + '.link'
+    try:
+        os.chmod(version, 0o755)
+        write(version)
+        os.symlink(os.path.basename(version), link)
+        old = None
+        if os.path.islink(dest):
+            old = os.path.join(parent, os.readlink(dest))
+        elif os.path.isdir(dest):
+            old = version + '.old'
+            os.rename(dest, old)
+        os.replace(link, dest)
+    except BaseException:
+        if os.path.lexists(link):
+            os.remove(link)
+        shutil.rmtree(version, ignore_errors=True)
+        raise
+    # удаляем только свои прежние версии, а не каталог, на который ссылку поставил кто-то другой
+    if old is not None and os.path.basename(old).startswith(prefix):
+        shutil.rmtree(old, ignore_errors=True)
+    return dest
+
+
+# Сохраняет массивы и манифест в каталог dest. Манифест пишется последним, поэтому каталог без него считается неполным.
+def export_model(clf, dest):
+    def write(path):
+        for name in ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), np.asarray(getattr(clf, name + '_')))
+        _write_manifest(path, {'format': FORMAT,
+                               'version': VERSION,
+                               'estimator': type(clf).__name__,
+                               'params': json_params(clf),
+                               'n_features': int(clf.coef_.shape[1]),
+                               'dtype': str(clf.coef_.dtype)})
+    return _publish(dest, write)
+
+
+# Сохраняет только веса с |w| > threshold в виде строк CSR: номера признаков indices и значения float32 (при quantize=True -
+# int8 с общим масштабом scale = max|w| / 127), а indptr из n_classes + 1 чисел отделяет веса одного класса от другого.
+def export_sparse(clf, dest, threshold=0.0, quantize=False):
+    coef = np.asarray(clf.coef_)
+    rows, cols = np.nonzero(np.abs(coef) > threshold)
+    values = coef[rows, cols]
+    scale = None
+    if quantize:
+        scale = float(np.max(np.abs(values)) / 127.0) if len(values) else 1.0
+        values = np.round(values / scale).astype(np.int8)
+        # веса, которые после квантования стали нулевыми, хранить незачем
+        keep = values != 0
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+    else:
+        values = values.astype(np.float32)
+    # np.nonzero перебирает элементы по строкам, поэтому номера признаков уже упорядочены внутри каждого класса
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=coef.shape[0]))]).astype(np.int64)
+    arrays = {'indptr': indptr, 'indices': cols.astype(np.int32), 'values': values,
+              'intercept': np.asarray(clf.intercept_), 'classes': np.asarray(clf.classes_)}
+
+    def write(path):
+        for name in SPARSE_ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), arrays[name])
+        _write_manifest(path, {'format': SPARSE_FORMAT,
+                               'version': SPARSE_VERSION,
+                               'estimator': type(clf).__name__,
+                               'loss': clf.get_params().get('loss'),
+                               'shape': list(coef.shape),
+                               'threshold': threshold,
+                               'scale': scale,
+                               'nnz': int(len(values))})
+    return _publish(dest, write)
+
+
+class SparseLinearModel(object):
+    # Линейная модель с разреженными весами: decision_function = X * W^T + intercept, где X - хэшированные строки CSR
+    def __init__(self, W, intercept, classes, loss):
+        self.W = W
+        self.intercept_ = intercept
+        self.classes_ = classes
+        self.loss = loss
+
+    @property
+    def nbytes(self):
+        return self.W.data.nbytes + self.W.indices.nbytes + self.W.indptr.nbytes + self.intercept_.nbytes
+
+    def decision_function(self, X):
+        scores = np.asarray((csr_matrix(X) * self.W.T).todense()) + self.intercept_
+        return scores.ravel() if scores.shape[1] == 1 else scores
+
+    def predict(self, X):
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            return self.classes_[(scores > 0).astype(int)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+    # Как в SGDClassifier с логистическими потерями: сигмоида, для нескольких классов - нормированная схема "один против всех"
+    def predict_proba(self, X):
+        if self.loss not in ('log', 'log_loss'):
+            raise AttributeError('predict_proba доступен только для loss="log", а не %r' % self.loss)
+        prob = expit(self.decision_function(X))
+        if prob.ndim == 1:
+            return np.vstack([1 - prob, prob]).T
+        prob /= prob.sum(axis=1)[:, np.newaxis]
+        return prob
+
+    def score(self, X, y):
+        return np.mean(self.predict(X) == np.asarray(y))
+
+
+def _load_sparse(path, manifest):
+    arrays = dict((name, np.load(os.path.join(path, name + '.npy'))) for name in SPARSE_ARRAYS)
+    values = arrays['values'].astype(np.float32)
+    if manifest['scale'] is not None:
+        values *= manifest['scale']
+    W = csr_matrix((values, arrays['indices'], arrays['indptr']), shape=tuple(manifest['shape']))
+    return SparseLinearModel(W, arrays['intercept'], arrays['classes'], manifest['loss'])
+
+
+def is_model_dir(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, 'manifest.json'))
+
+
+# Загружает модель как SGDClassifier, у которого coef_, intercept_ и classes_ - массивы, отображенные в память
+# (mmap_mode=None загружает их в память целиком). Параметры, неизвестные текущей версии scikit-learn, пропускаются.
+# Разреженная модель загружается как SparseLinearModel.
+def load_model(path, mmap_mode='r'):
+    # ссылка разрешается один раз, чтобы манифест и массивы были из одной версии; если версию удалили во время
+    # загрузки, читаем ту, на которую ссылка указывает теперь
+    real = os.path.realpath(path)
+    try:
+        return _load_version(real, mmap_mode)
+    except FileNotFoundError:
+        if os.path.realpath(path) == real:
+            raise
+        return _load_version(os.path.realpath(path), mmap_mode)
+
+
+def _load_version(path, mmap_mode):
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('format') == SPARSE_FORMAT and manifest.get('version') == SPARSE_VERSION:
+        return _load_sparse(path, manifest)
+    if manifest.get('format') != FORMAT or manifest.get('version') != VERSION:
+        raise ValueError('Неизвестный формат модели в %s: %s/%s' % (path, manifest.get('format'), manifest.get('version')))
+    arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in ARRAYS]
+    return build_classifier(manifest['params'], *arrays)
+
+
+# SGDClassifier из параметров и готовых массивов (в том числе отображенных в память или в общей памяти)
+def build_classifier(params, coef, intercept, classes):
+    known = SGDClassifier().get_params()
+    clf = SGDClassifier(**dict((k, v) for k, v in params.items() if k in known))
+    clf.coef_, clf.intercept_, clf.classes_ = coef, intercept, classes
+    return clf
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+# Размер на диске, объем весов в памяти, время загрузки и верность на n_test последних документах корпуса
+# для плотной модели и разреженных вариантов
+def compare(clf, csv_path, workdir, thresholds=(0.0, 1e-3, 1e-2), n_test=5000):
+    import time
+    from .stream_reader import stream_batches
+    from .vectorizer import vect
+
+    docs, y = [], []
+    for texts, labels in stream_batches(csv_path, batch_size=10000):
+        docs = (docs + texts)[-n_test:]
+        y = (y + labels)[-n_test:]
+    X = vect.transform(docs)
+
+    variants = [('pickle', None), ('npy', None)]
+    variants += [('sparse t=%g' % t, dict(threshold=t)) for t in thresholds]
+    variants += [('sparse int8 t=%g' % t, dict(threshold=t, quantize=True)) for t in thresholds]
+    results = []
+    for name, options in variants:
+        dest = os.path.join(workdir, name.replace(' ', '_').replace('=', ''))
+        if name == 'pickle':
+            if not os.path.exists(dest):
+                os.makedirs(dest)
+            with open(os.path.join(dest, 'classifier.pkl'), 'wb') as f:
+                pickle.dump(clf, f, protocol=4)
+        elif options is None:
+            export_model(clf, dest)
+        else:
+            export_sparse(clf, dest, **options)
+        start = time.perf_counter()
+        if name == 'pickle':
+            with open(os.path.join(dest, 'classifier.pkl'), 'rb') as f:
+                model = pickle.load(f)
+        else:
+            model = load_model(dest, mmap_mode=None)
+        load_s = time.perf_counter() - start
+        memory = model.nbytes if isinstance(model, SparseLinearModel) else model.coef_.nbytes + model.intercept_.nbytes
+        results.append({'variant': name, 'disk_kb': round(_dir_size(dest) / 1024.0, 1),
+                        'memory_kb': round(memory / 1024.0, 1), 'load_ms': round(load_s * 1000, 2),
+                        'accuracy': round(float(model.score(X, y)), 4)})
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Экспорт классификатора в массивы .npy')
+    parser.add_argument('src', help='classifier.pkl')
+    parser.add_argument('dest', nargs='?', help='каталог модели')
+    parser.add_argument('--sparse', action='store_true', help='хранить только ненулевые веса')
+    parser.add_argument('--quantize', action='store_true', help='квантовать веса в int8 (вместе с --sparse)')
+    parser.add_argument('--threshold', type=float, default=0.0, help='отбрасывать веса с |w| <= threshold')
+    parser.add_argument('--compare', metavar='CSV', help='сравнить форматы на последних 5000 документах CSV')
+    args = parser.parse_args()
+
+    with open(args.src, 'rb') as f:
+        clf = pickle.load(f)
+    if args.compare:
+        for row in compare(clf, args.compare, args.dest or tempfile.mkdtemp()):
+            print(json.dumps(row))
+    elif args.sparse:
+        export_sparse(clf, args.dest, threshold=args.threshold, quantize=args.quantize)
+        print('Модель сохранена в %s' % args.dest)
+    else:
+        export_model(clf, args.dest)
+        print('Модель сохранена в %s' % args.dest)
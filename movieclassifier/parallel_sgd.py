@@ -0,0 +1,138 @@
+# Параллельный стохастический градиентный спуск с усреднением параметров.
+# N дочерних процессов обучают собственные копии классификатора partial_fit на своих частях корпуса и через каждые
+# sync_every мини-пакетов усредняют коэффициенты coef_ и intercept_. Векторы шириной 2^21 не консервируются: каждый процесс
+# записывает свои коэффициенты в свою строку общего блока памяти multiprocessing.shared_memory, затем каждый процесс
+# усредняет свой диапазон признаков и после второго барьера копирует среднее в свой классификатор.
+#
+# Сравнение с однопроцессным циклом: python -m movieclassifier.parallel_sgd ./data/movie_data.csv 4
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+from sklearn.base import clone
+
+from .corpus_index import CorpusReader
+
+
+def _worker(rank, n_workers, clf, path, indices, vect, classes, batch_size, sync_every, n_epochs, seed,
+            shm_name, shape, barrier, results):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # строки 0..n_workers-1 - коэффициенты процессов, последняя строка - среднее; последний столбец - intercept_
+    slots = np.ndarray((n_workers + 1,) + shape, dtype=np.float64, buffer=shm.buf)
+    avg = slots[n_workers]
+    try:
+        bounds = np.linspace(0, shape[-1], n_workers + 1).astype(int)
+        lo, hi = bounds[rank], bounds[rank + 1]
+        reader = CorpusReader(path)
+        for epoch in range(n_epochs):
+            order = np.random.RandomState(seed + epoch).permutation(indices)
+            batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+            for start in range(0, len(batches), sync_every):
+                for idx in batches[start:start + sync_every]:
+                    docs, y = reader.get_minibatch(idx)
+                    clf.partial_fit(vect.transform(docs), y, classes=classes)
+                slots[rank, :, :-1] = clf.coef_
+                slots[rank, :, -1] = clf.intercept_
+                barrier.wait()
+                avg[:, lo:hi] = slots[:n_workers, :, lo:hi].mean(axis=0)
+                barrier.wait()
+                clf.coef_[...] = avg[:, :-1]
+                clf.intercept_[...] = avg[:, -1]
+        reader.close()
+        if rank == 0:
+            # коэффициенты мастер возьмет из общей памяти, поэтому передаем классификатор без них
+            clf.coef_ = clf.coef_[:, :0]
+            results.put(clf)
+    finally:
+        # представления должны быть удалены до закрытия общей памяти
+        del slots, avg
+        shm.close()
+
+
+# Обучение clf на документах indices (по умолчанию весь корпус) в n_workers процессах.
+# Каждый процесс получает одинаковое число полных мини-пакетов (остаток отбрасывается, как и в get_minibatch),
+# поэтому все процессы проходят одинаковое число синхронизаций.
+def train_parallel(clf, path, vect, classes, n_workers=4, batch_size=1000, sync_every=5, n_epochs=1, indices=None,
+                   seed=1):
+    classes = np.asarray(classes)
+    if indices is None:
+        with CorpusReader(path) as reader:
+            indices = np.arange(len(reader))
+    indices = np.random.RandomState(seed).permutation(indices)
+    per_worker = len(indices) // (n_workers * batch_size) * batch_size
+    if per_worker == 0:
+        raise ValueError('Недостаточно документов для %d процессов по %d документов' % (n_workers, batch_size))
+
+    n_rows = 1 if len(classes) == 2 else len(classes)
+    shape = (n_rows, vect.n_features + 1)
+    shm = shared_memory.SharedMemory(create=True, size=(n_workers + 1) * n_rows * shape[1] * 8)
+    barrier = multiprocessing.Barrier(n_workers)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_worker,
+                                     args=(rank, n_workers, clone(clf), path,
+                                           indices[rank * per_worker:(rank + 1) * per_worker], vect, classes,
+                                           batch_size, sync_every, n_epochs, seed + rank, shm.name, shape,
+                                           barrier, results))
+             for rank in range(n_workers)]
+    try:
+        for p in procs:
+            p.start()
+        # если один из процессов упал, снимаем остальные с барьера, чтобы они не ждали вечно
+        model = None
+        while model is None:
+            try:
+                model = results.get(timeout=0.5)
+            except queue.Empty:
+                if any(p.exitcode not in (None, 0) for p in procs):
+                    barrier.abort()
+                    raise RuntimeError('Процесс обучения завершился с ошибкой: %s' % [p.exitcode for p in procs])
+        for p in procs:
+            p.join()
+        avg = np.ndarray((n_workers + 1,) + shape, dtype=np.float64, buffer=shm.buf)[n_workers]
+        model.coef_ = avg[:, :-1].copy()
+        model.intercept_ = avg[:, -1].copy()
+        del avg
+        return model
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        shm.close()
+        shm.unlink()
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import sklearn
+    from sklearn.linear_model import SGDClassifier
+    from .vectorizer import vect
+
+    # SGDClassifier(loss='log', n_iter=1) из учебных скриптов: в новых версиях scikit-learn потери называются
+    # 'log_loss' (с версии 1.1, а 'log' удален в 1.3), а число проходов задает max_iter вместо n_iter (с версии 0.21)
+    def make_sgd():
+        if 'n_iter' in SGDClassifier().get_params():
+            return SGDClassifier(loss='log', random_state=1, n_iter=1)
+        version = tuple(int(part) for part in sklearn.__version__.split('.')[:2])
+        return SGDClassifier(loss='log_loss' if version >= (1, 1) else 'log', random_state=1, max_iter=1)
+
+    path = sys.argv[1] if len(sys.argv) > 1 else './data/movie_data.csv'
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    classes = np.array([0, 1])
+    reader = CorpusReader(path)
+    train_idx, test_idx = reader.train_test_split(5000, seed=1)
+    X_test, y_test = reader.get_minibatch(test_idx)
+    X_test = vect.transform(X_test)
+
+    # Текущий однопроцессный цикл из 27_big_data_out_of_core.py
+    clf = make_sgd()
+    start = time.time()
+    for X_train, y_train in reader.iter_minibatches(1000, indices=train_idx, seed=1):
+        clf.partial_fit(vect.transform(X_train), y_train, classes=classes)
+    print('1 процесс: %.1f с, верность %.3f' % (time.time() - start, clf.score(X_test, y_test)))
+
+    start = time.time()
+    clf = train_parallel(make_sgd(), path, vect, classes,
+                         n_workers=n_workers, indices=train_idx)
+    print('%d процессов: %.1f с, верность %.3f' % (n_workers, time.time() - start, clf.score(X_test, y_test)))
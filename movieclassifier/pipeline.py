@@ -0,0 +1,176 @@
+# Конвейерное обучение вне ядра.
+# В 27_big_data_out_of_core.py чтение мини-пакета, лексемизация, хэширование и partial_fit выполняются строго друг за другом
+# в одном потоке, поэтому занято только одно ядро. Здесь чтение выполняет отдельный поток-поставщик, лексемизацию и хэширование
+# HashingVectorizer.transform - пул процессов, а основной процесс только вызывает partial_fit на готовых CSR мини-пакетах.
+# Перед partial_fit держим ограниченную очередь мини-пакетов (prefetch), чтобы память не росла, если классификатор не успевает.
+# Порядок мини-пакетов сохраняется, поэтому при одинаковом random_state модель совпадает с последовательным вариантом.
+import multiprocessing
+import queue
+import threading
+import time
+
+from .stats import split_vectorizer, timed_transform
+
+# Векторизатор дочернего процесса: передается один раз при запуске пула, а не с каждым мини-пакетом
+_vect = None
+_split = None
+
+
+def _init_worker(vect):
+    global _vect
+    _vect = vect
+
+
+def _transform(docs):
+    return _vect.transform(docs)
+
+
+# Векторизация с раздельным замером лексемизации и хэширования (для PipelineStats)
+def _transform_timed(docs):
+    global _split
+    if _split is None:
+        _split = split_vectorizer(_vect)
+    return timed_transform(_split[0], _split[1], docs)
+
+
+# Чтение мини-пакетов с замером времени: возвращает (docs, y, (read_s, n_bytes))
+def _timed_batches(batches, count_bytes=False):
+    it = iter(batches)
+    while True:
+        start = time.perf_counter()
+        try:
+            docs, y = next(it)
+        except StopIteration:
+            return
+        read_s = time.perf_counter() - start
+        yield docs, y, (read_s, sum(len(doc.encode('utf-8')) for doc in docs) if count_bytes else None)
+
+
+# Генератор мини-пакетов с той же логикой, что и get_minibatch из 27_big_data_out_of_core.py: неполный последний пакет
+# отбрасывается, n_batches ограничивает число пакетов (None - до конца потока).
+def iter_minibatches(doc_stream, size, n_batches=None):
+    i = 0
+    while n_batches is None or i < n_batches:
+        docs, y = [], []
+        try:
+            for _ in range(size):
+                text, label = next(doc_stream)
+                docs.append(text)
+                y.append(label)
+        except StopIteration:
+            return
+        yield docs, y
+        i += 1
+
+
+class VectorizingPool(object):
+    # n_jobs - число процессов пула (None - по числу ядер, 1 - последовательный режим без пула),
+    # prefetch - сколько мини-пакетов может ожидать partial_fit.
+    def __init__(self, vect, n_jobs=None, prefetch=4):
+        if prefetch < 1:
+            raise ValueError('prefetch должен быть не меньше 1, получено %r' % prefetch)
+        self.vect = vect
+        self.n_jobs = n_jobs if n_jobs is not None else multiprocessing.cpu_count()
+        self.prefetch = prefetch
+        self._pool = None
+        self._pending = None
+        if self.n_jobs > 1:
+            self._pool = multiprocessing.Pool(self.n_jobs, initializer=_init_worker, initargs=(vect,))
+
+    # Текущая глубина очереди мини-пакетов перед partial_fit
+    def qsize(self):
+        return self._pending.qsize() if self._pending is not None else 0
+
+    # Возвращает пары (X, y), где X - разреженная CSR-матрица, в том же порядке, в котором пакеты пришли из batches.
+    # Если задан stats (PipelineStats), в него добавляется время чтения, лексемизации и хэширования каждого пакета;
+    # запись о пакете завершает вызывающий код после partial_fit.
+    def imap(self, batches, stats=None):
+        if self._pool is None:
+            split = split_vectorizer(self.vect) if stats is not None else None
+            for docs, y, (read_s, n_bytes) in _timed_batches(batches, stats is not None):
+                if stats is None:
+                    yield self.vect.transform(docs), y
+                    continue
+                X, tokenize_s, hash_s = timed_transform(split[0], split[1], docs)
+                stats.add_bytes(n_bytes)
+                stats.add_time('read', read_s)
+                stats.add_time('tokenize', tokenize_s)
+                stats.add_time('hash', hash_s)
+                yield X, y
+            return
+
+        pending = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        self._pending = pending
+        func = _transform if stats is None else _transform_timed
+
+        # Ожидание места в очереди прерывается, если потребитель уже остановился
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def feed():
+            try:
+                for docs, y, meta in _timed_batches(batches, stats is not None):
+                    if not put((self._pool.apply_async(func, (docs,)), y, meta)):
+                        return
+            except BaseException as e:
+                put(e)
+                return
+            put(None)
+
+        feeder = threading.Thread(target=feed, name='minibatch-feeder')
+        feeder.daemon = True
+        feeder.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                res, y, (read_s, n_bytes) = item
+                if stats is None:
+                    yield res.get(), y
+                    continue
+                X, tokenize_s, hash_s = res.get()
+                stats.add_bytes(n_bytes)
+                stats.add_time('read', read_s)
+                stats.add_time('tokenize', tokenize_s)
+                stats.add_time('hash', hash_s)
+                yield X, y
+        finally:
+            stop.set()
+            feeder.join()
+            self._pending = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Обучение классификатора на потоке мини-пакетов (docs, y). Возвращает классификатор.
+# stats (PipelineStats) получает по одной записи на мини-пакет с временем всех этапов и глубиной очереди.
+def train_pipelined(clf, batches, vect, classes, n_jobs=None, prefetch=4, stats=None):
+    with VectorizingPool(vect, n_jobs=n_jobs, prefetch=prefetch) as pool:
+        for X_train, y_train in pool.imap(batches, stats=stats):
+            if stats is None:
+                clf.partial_fit(X_train, y_train, classes=classes)
+                continue
+            with stats.stage('partial_fit'):
+                clf.partial_fit(X_train, y_train, classes=classes)
+            stats.record(X_train.shape[0], queue_depth=pool.qsize() if pool.n_jobs > 1 else None)
+    return clf
@@ -0,0 +1,108 @@
+# LRU-кэш прогнозов с ограничением времени жизни записей (TTL).
+# В трафике к классификатору много повторов и почти повторов: репосты, шаблоны, отличающиеся только пробелами или регистром.
+# Ключ кэша - хэш последовательности лексем после лексемизатора (нижний регистр, без html-разметки, знаков препинания
+# и стоп-слов), поэтому такие отзывы совпадают. При попадании в кэш хэширование признаков и predict_proba пропускаются,
+# а при промахе уже полученные лексемы передаются прямо в хэширующую часть векторизатора без повторной лексемизации.
+# Кэш привязан к объекту классификатора: как только передан другой объект (например, загружен новый classifier.pkl),
+# кэш очищается.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .stats import split_vectorizer
+
+
+class PredictionCache(object):
+    # max_size - наибольшее число записей, ttl - время жизни записи в секундах (None - без ограничения)
+    def __init__(self, max_size=100000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = self.expired = self.invalidations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._clf = None
+        self._vect = None
+        self._split = None
+
+    @staticmethod
+    def key(tokens):
+        return hashlib.blake2b('\x00'.join(tokens).encode('utf-8'), digest_size=16).digest()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / float(total), 4) if total else None, 'evictions': self.evictions,
+                'expired': self.expired, 'invalidations': self.invalidations}
+
+    def _get(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        proba, stored = item
+        if self.ttl is not None and now - stored > self.ttl:
+            del self._data[key]
+            self.expired += 1
+            return None
+        self._data.move_to_end(key)
+        return proba
+
+    def _put(self, key, proba, now):
+        self._data[key] = (proba, now)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    # Кэш очищается, если классификатор сменился; векторизатор разделяется на лексемизатор и хэширующую часть один раз
+    def _bind(self, clf, vectorizer):
+        if clf is not self._clf:
+            if self._clf is not None:
+                self.invalidations += 1
+            self._data.clear()
+            self._clf = clf
+        if vectorizer is not self._vect:
+            self._vect = vectorizer
+            self._split = split_vectorizer(vectorizer)
+
+    # Матрица вероятностей классов для списка отзывов: из кэша, а для промахов - одним вызовом predict_proba.
+    # Одинаковые после лексемизации отзывы внутри пакета (например, одновременные репосты) прогнозируются один раз:
+    # промахом считается только первый из них, остальные - попаданиями.
+    def predict_proba(self, clf, texts, vectorizer):
+        with self._lock:
+            self._bind(clf, vectorizer)
+            analyzer, hasher = self._split
+        tokens = [analyzer(text) for text in texts]
+        keys = [self.key(t) for t in tokens]
+        result = [None] * len(texts)
+        now = time.monotonic()
+        missing = OrderedDict()  # ключ -> номера отзывов пакета с этим ключом
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in missing:
+                    missing[key].append(i)
+                    continue
+                result[i] = self._get(key, now)
+                if result[i] is None:
+                    missing[key] = [i]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            proba = clf.predict_proba(hasher.transform([tokens[rows[0]] for rows in missing.values()]))
+            with self._lock:
+                for (key, rows), row in zip(missing.items(), proba):
+                    for i in rows:
+                        result[i] = row
+                    # если классификатор сменился во время вычисления, не кладем устаревший прогноз
+                    if clf is self._clf:
+                        self._put(key, row, now)
+        return np.vstack(result)
@@ -0,0 +1,230 @@
+# Предварительно порожденные (prefork) рабочие процессы сервиса с общей для всех моделью.
+# Если запустить несколько процессов service.py, каждый расконсервирует свою копию классификатора и стоп-слов.
+# Здесь главный процесс один раз загружает classifier.pkl, копирует coef_ в сегмент multiprocessing.shared_memory
+# и порождает (os.fork) рабочие процессы, которые отображают этот сегмент только для чтения, поэтому память не растет
+# с числом процессов. Все рабочие процессы принимают соединения на одном общем слушающем сокете.
+#
+# Перезагрузка модели (SIGHUP главному процессу или замена файла модели): главный процесс создает новый сегмент,
+# записывает его имя и новое поколение в маленький управляющий сегмент, и каждый рабочий процесс при следующей
+# проверке (раз в check_interval секунд) переключается на новый сегмент. Старый сегмент удаляется сразу: ОС держит
+# его страницы, пока последний рабочий процесс не отключится от него.
+#
+# python -m movieclassifier.prefork --workers 4 --port 8000
+import argparse
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .model_store import build_classifier, json_params
+from .service import MicroBatcher, PredictHandler, PredictServer, load_classifier
+from .vectorizer import cur_dir
+
+# Управляющий сегмент: поколение (int64) и имя сегмента с коэффициентами (до 64 байт)
+_CONTROL = struct.Struct('q64s')
+
+
+class SharedModel(object):
+    # Сегмент хранит coef_ и следом intercept_ (float64); параметры и classes_ невелики и передаются при fork
+    def __init__(self, clf, generation):
+        coef = np.asarray(clf.coef_, dtype=np.float64)
+        intercept = np.asarray(clf.intercept_, dtype=np.float64)
+        self.shm = shared_memory.SharedMemory(create=True, size=coef.nbytes + intercept.nbytes)
+        coef_view, intercept_view = _views(self.shm, coef.shape)
+        coef_view[...] = coef
+        intercept_view[...] = intercept
+        self.name = self.shm.name
+        self.shape = coef.shape
+        self.generation = generation
+        self.params = json_params(clf)
+        self.classes = np.array(clf.classes_)
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _views(shm, shape):
+    coef = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    intercept = np.ndarray((shape[0],), dtype=np.float64, buffer=shm.buf, offset=coef.nbytes)
+    return coef, intercept
+
+
+# Подключение рабочего процесса к сегменту модели: coef_ и intercept_ - представления общей памяти только для чтения
+def attach(name, shape, params, classes):
+    shm = shared_memory.SharedMemory(name=name)
+    coef, intercept = _views(shm, shape)
+    coef.flags.writeable = False
+    intercept.flags.writeable = False
+    return shm, build_classifier(params, coef, intercept, classes)
+
+
+class Master(object):
+    def __init__(self, path, host='127.0.0.1', port=8000, workers=4, check_interval=0.5, max_batch=256,
+                 max_wait_ms=5):
+        self.path = path
+        self.workers = workers
+        self.check_interval = check_interval
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(1024)
+        self.control = shared_memory.SharedMemory(create=True, size=_CONTROL.size)
+        self.model = None
+        self.children = {}
+        self._stamp = None
+        self._reload = False
+        self._running = True
+        self.publish(load_classifier(path))
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    # Переносит модель в новый сегмент общей памяти и сообщает о нем рабочим процессам
+    def publish(self, clf):
+        self._stamp = self._file_stamp()
+        old = self.model
+        self.model = SharedModel(clf, old.generation + 1 if old is not None else 1)
+        _CONTROL.pack_into(self.control.buf, 0, self.model.generation, self.model.name.encode('ascii'))
+        if old is not None:
+            old.release()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                Worker(self).serve()
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = True
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, '_reload', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, '_running', False))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, '_running', False))
+        for _ in range(self.workers):
+            self.spawn()
+        print('Prefork-сервис: %d процессов на http://%s:%d/predict (pid %d)'
+              % (self.workers, self.sock.getsockname()[0], self.sock.getsockname()[1], os.getpid()))
+        try:
+            while self._running:
+                time.sleep(self.check_interval)
+                # упавшие рабочие процессы заменяем новыми
+                while self.children:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                    if pid == 0:
+                        break
+                    self.children.pop(pid, None)
+                    if self._running:
+                        self.spawn()
+                try:
+                    changed = self._file_stamp() != self._stamp
+                except OSError:
+                    changed = False
+                if self._reload or changed:
+                    self._reload = False
+                    try:
+                        self.publish(load_classifier(self.path))
+                        print('Модель перезагружена, поколение %d' % self.model.generation)
+                    except Exception as e:
+                        print('Не удалось загрузить модель %s: %r' % (self.path, e))
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in list(self.children):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.children.clear()
+        self.sock.close()
+        self.model.release()
+        self.control.close()
+        self.control.unlink()
+
+
+class Worker(object):
+    def __init__(self, master):
+        self.master = master
+        self.control = master.control
+        model = master.model
+        self.generation = model.generation
+        self.shm, clf = attach(model.name, model.shape, model.params, model.classes)
+        self.batcher = MicroBatcher(clf, max_batch=master.max_batch, max_wait_ms=master.max_wait_ms)
+
+    # Проверяет управляющий сегмент и при смене поколения подключается к новому сегменту модели.
+    # Параметры, размер и classes_ модели не меняются при дообучении, поэтому берем их из унаследованного описания.
+    def _watch(self):
+        model = self.master.model
+        while True:
+            time.sleep(self.master.check_interval)
+            generation, name = _CONTROL.unpack_from(self.control.buf, 0)
+            if generation == self.generation:
+                continue
+            try:
+                shm, clf = attach(name.rstrip(b'\x00').decode('ascii'), model.shape, model.params, model.classes)
+            except FileNotFoundError:
+                continue  # сегмент уже заменен следующим поколением
+            old, self.shm = self.shm, shm
+            self.batcher.clf = clf
+            self.generation = generation
+            threading.Timer(5.0, self._close, (old,)).start()
+
+    # Старый сегмент остается отображенным, пока на него ссылается классификатор в уже начатом пакете
+    def _close(self, shm):
+        try:
+            shm.close()
+        except BufferError:
+            threading.Timer(5.0, self._close, (shm,)).start()
+
+    def serve(self):
+        watcher = threading.Thread(target=self._watch, name='shared-model-watcher')
+        watcher.daemon = True
+        watcher.start()
+        handler = type('Handler', (PredictHandler,), {'batcher': self.batcher})
+        server = PredictServer(self.master.sock.getsockname(), handler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = self.master.sock
+        server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prefork HTTP-сервис прогнозирования мнений с моделью в общей памяти')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--classifier', default=None, help='путь к classifier.pkl или каталогу модели .npy')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--reload-interval', type=float, default=0.5,
+                        help='как часто проверять файл модели и поколение в общей памяти')
+    args = parser.parse_args(argv)
+
+    path = args.classifier or os.path.join(cur_dir, 'pkl_objects', 'classifier.pkl')
+    Master(path, args.host, args.port, args.workers, args.reload_interval, args.max_batch, args.max_wait_ms).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+# Локальный HTTP-сервис прогнозирования мнений с объединением запросов в мини-пакеты.
+# В 28_ml_and_web.py каждый отзыв обрабатывается отдельно: vect.transform(example), затем clf.predict и clf.predict_proba,
+# т.е. по отдельному построению разреженной матрицы и два вызова классификатора на каждый отзыв. Здесь запросы,
+# пришедшие одновременно, в течение max_wait_ms собираются в один пакет: одна матрица vect.transform на весь пакет
+# и один вызов predict_proba, из которого получаем и метку класса (argmax), и ее вероятность.
+#
+# Запуск из корня репозитория: python -m movieclassifier.service --port 8000
+# Запрос: curl -d '{"review": "I love this movie"}' http://localhost:8000/predict
+import argparse
+import json
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .model_store import is_model_dir, load_model
+from .prediction_cache import PredictionCache
+from .vectorizer import cur_dir, vect
+
+label = {0: 'negative', 1: 'positive'}
+
+
+# path - classifier.pkl или каталог модели из model_store.export_model (массивы отображаются в память)
+def load_classifier(path=None):
+    if path is None:
+        path = os.path.join(cur_dir, 'pkl_objects', 'classifier.pkl')
+    if is_model_dir(path):
+        return load_model(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# Идентификатор версии файла модели: os.replace создает новый inode, кроме того, учитываем время изменения и размер
+def model_stamp(path):
+    st = os.stat(os.path.join(path, 'manifest.json') if is_model_dir(path) else path)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+# Прогноз для списка отзывов одним вызовом predict_proba: список пар (метка, вероятность).
+# cache (PredictionCache) позволяет не векторизовать повторяющиеся отзывы.
+def predict_batch(clf, texts, vectorizer=vect, cache=None):
+    if cache is not None:
+        proba = cache.predict_proba(clf, texts, vectorizer)
+    else:
+        proba = clf.predict_proba(vectorizer.transform(texts))
+    best = np.argmax(proba, axis=1)
+    return [(label.get(c, c), p) for c, p in zip(clf.classes_[best].tolist(), proba[np.arange(len(best)), best].tolist())]
+
+
+class MicroBatcher(object):
+    # max_batch - наибольший размер пакета, max_wait_ms - сколько после первого запроса пакета ждать следующие
+    def __init__(self, clf, max_batch=256, max_wait_ms=5, vectorizer=vect, cache=None):
+        self.clf = clf
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.vectorizer = vectorizer
+        self.cache = cache
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    # Ставит отзыв в очередь; возвращает Future с парой (метка, вероятность)
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def predict(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            results = predict_batch(self.clf, [text for text, _ in batch], self.vectorizer, self.cache)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # ошибка одного отзыва не должна портить весь пакет: прогнозируем каждый отдельно
+            for item in batch:
+                self._process([item])
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+# Следит за файлом модели и после его атомарной замены (например, фоновым updater.py) подставляет новую модель в batcher.
+# Старая модель дообслуживает уже начатый пакет, поэтому замена проходит без остановки сервиса. request_reload()
+# (вызывается по сигналу SIGHUP) проверяет файл немедленно, не дожидаясь очередного интервала.
+class ModelWatcher(object):
+    def __init__(self, batcher, path, interval=1.0):
+        self.batcher = batcher
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self._stamp = model_stamp(path)
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='model-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request_reload(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop:
+                return
+            try:
+                stamp = model_stamp(self.path)
+                if stamp != self._stamp:
+                    self.batcher.clf = load_classifier(self.path)
+                    self._stamp = stamp
+                    self.reloads += 1
+            except Exception as e:
+                # недописанный или поврежденный файл: продолжаем со старой моделью и попробуем позже
+                print('Не удалось загрузить модель %s: %r' % (self.path, e))
+
+    def close(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+
+
+class PredictHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 позволяет клиентам не открывать новое соединение на каждый запрос
+    protocol_version = 'HTTP/1.1'
+    # без алгоритма Нейгла ответ не ждет подтверждения заголовков (иначе +40 мс на запрос)
+    disable_nagle_algorithm = True
+    batcher = None
+
+    # GET /stats - счетчики кэша прогнозов
+    def do_GET(self):
+        if self.path != '/stats':
+            self.send_error(404)
+            return
+        cache = self.batcher.cache
+        self._send_json(cache.stats() if cache is not None else {})
+
+    # Ошибки тоже отправляются в JSON: send_error кладет сообщение в строку статуса, а она допускает только latin-1
+    def _send_json(self, obj, status=200):
+        payload = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            review = body['review']
+            if not isinstance(review, str):
+                raise TypeError(review)
+        except (ValueError, KeyError, TypeError):
+            self._send_json({'error': 'Ожидается JSON вида {"review": "..."}'}, 400)
+            return
+        try:
+            prediction, probability = self.batcher.predict(review)
+        except Exception as e:
+            self._send_json({'error': repr(e)}, 500)
+            return
+        self._send_json({'prediction': prediction, 'probability': probability})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PredictServer(ThreadingHTTPServer):
+    # очередь входящих соединений по умолчанию (5) слишком мала для сотни одновременных клиентов
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def make_server(batcher, host='127.0.0.1', port=8000):
+    handler = type('Handler', (PredictHandler,), {'batcher': batcher})
+    return PredictServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HTTP-сервис прогнозирования мнений')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--classifier', default=None, help='путь к classifier.pkl или каталогу модели .npy')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--cache-size', type=int, default=0, help='размер LRU-кэша прогнозов (0 - без кэша)')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='время жизни записи кэша в секундах')
+    parser.add_argument('--reload-interval', type=float, default=1.0,
+                        help='как часто проверять, не заменен ли файл модели (0 - не проверять)')
+    args = parser.parse_args(argv)
+
+    path = args.classifier or os.path.join(cur_dir, 'pkl_objects', 'classifier.pkl')
+    cache = PredictionCache(args.cache_size, args.cache_ttl) if args.cache_size > 0 else None
+    batcher = MicroBatcher(load_classifier(path), max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, cache=cache)
+    watcher = None
+    if args.reload_interval > 0:
+        watcher = ModelWatcher(batcher, path, args.reload_interval)
+        signal.signal(signal.SIGHUP, lambda signum, frame: watcher.request_reload())
+    server = make_server(batcher, args.host, args.port)
+    print('Сервис запущен на http://%s:%d/predict (pid %d)' % (args.host, args.port, os.getpid()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if watcher is not None:
+            watcher.close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# Измерение пропускной способности этапов потокового конвейера обработки текста.
+# Единственный индикатор хода обучения в 27_big_data_out_of_core.py - pyprind.ProgBar(45). PipelineStats для каждого
+# мини-пакета записывает время этапов чтения (read), лексемизации (tokenize), хэширования (hash) и обучения (partial_fit),
+# скорость в документах и байтах в секунду, глубину очереди (для конвейера из pipeline.py) и пиковый объем резидентной
+# памяти (RSS). Записи можно сохранять в файл в формате JSON lines, по одной строке на мини-пакет.
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+from sklearn.base import clone
+
+STAGES = ('read', 'tokenize', 'hash', 'partial_fit')
+
+
+# Пиковый RSS в Мб: ru_maxrss в Linux измеряется в Кб, а в macOS - в байтах.
+# Для дочерних процессов учитываются только уже завершившиеся.
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / 2.0**20 if sys.platform == 'darwin' else rss / 1024.0
+
+
+def _identity(tokens):
+    return tokens
+
+
+# Разделяет HashingVectorizer на анализатор (лексемизация) и хэширующую часть, принимающую готовые лексемы,
+# чтобы время этих этапов можно было измерить отдельно. Результат совпадает с vect.transform.
+def split_vectorizer(vect):
+    return vect.build_analyzer(), clone(vect).set_params(analyzer=_identity)
+
+
+# Векторизация с замером времени этапов; возвращает (X, tokenize_s, hash_s)
+def timed_transform(analyzer, hasher, docs):
+    start = time.perf_counter()
+    tokens = [analyzer(doc) for doc in docs]
+    tokenized = time.perf_counter()
+    X = hasher.transform(tokens)
+    return X, tokenized - start, time.perf_counter() - tokenized
+
+
+class PipelineStats(object):
+    # path - файл JSON lines (None - только хранить записи в памяти), verbose - печатать каждую запись
+    def __init__(self, path=None, verbose=False):
+        self.records = []
+        self.verbose = verbose
+        self._out = open(path, 'a') if path is not None else None
+        self._times = dict.fromkeys(STAGES, 0.0)
+        self._bytes = None
+        self._started = time.perf_counter()
+        self._last = self._started
+
+    # Замер этапа в последовательном цикле: with stats.stage('read'): ...
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    # Время этапа, измеренное в другом месте (например, в дочернем процессе)
+    def add_time(self, name, seconds):
+        self._times[name] = self._times.get(name, 0.0) + seconds
+
+    # Объем текущего мини-пакета в байтах, если его считали при чтении
+    def add_bytes(self, n_bytes):
+        if n_bytes is not None:
+            self._bytes = (self._bytes or 0) + n_bytes
+
+    # Завершает запись о мини-пакете. docs - тексты пакета (для подсчета байтов) или их число.
+    def record(self, docs, n_bytes=None, queue_depth=None):
+        now = time.perf_counter()
+        if n_bytes is None:
+            n_bytes = self._bytes
+        if isinstance(docs, int):
+            n_docs = docs
+        else:
+            n_docs = len(docs)
+            if n_bytes is None:
+                n_bytes = sum(len(doc.encode('utf-8')) for doc in docs)
+        wall = now - self._last
+        rec = {'batch': len(self.records),
+               'time': round(now - self._started, 4),
+               'wall_s': round(wall, 4),
+               'n_docs': n_docs,
+               'n_bytes': n_bytes,
+               'docs_per_s': round(n_docs / wall, 1) if wall > 0 else None,
+               'bytes_per_s': round(n_bytes / wall, 1) if wall > 0 and n_bytes is not None else None,
+               'queue_depth': queue_depth,
+               'peak_rss_mb': round(peak_rss_mb(), 1),
+               'peak_rss_children_mb': round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)}
+        for name, seconds in self._times.items():
+            rec[name + '_s'] = round(seconds, 4)
+        self.records.append(rec)
+        if self._out is not None:
+            self._out.write(json.dumps(rec) + '\n')
+            self._out.flush()
+        if self.verbose:
+            print(self.format(rec))
+        self._times = dict.fromkeys(STAGES, 0.0)
+        self._bytes = None
+        self._last = now
+        return rec
+
+    @staticmethod
+    def format(rec):
+        stages = ' '.join('%s=%.3fs' % (name, rec.get(name + '_s', 0.0)) for name in STAGES)
+        depth = '' if rec['queue_depth'] is None else ' queue=%d' % rec['queue_depth']
+        return '[%d] %s док/с %s%s rss=%.0fMb' % (rec['batch'], rec['docs_per_s'], stages, depth, rec['peak_rss_mb'])
+
+    # Итог по всем мини-пакетам: суммарное время этапов и средняя скорость
+    def summary(self):
+        total = dict((name + '_s', round(sum(r.get(name + '_s', 0.0) for r in self.records), 4)) for name in STAGES)
+        wall = sum(r['wall_s'] for r in self.records)
+        n_docs = sum(r['n_docs'] for r in self.records)
+        total.update({'batches': len(self.records), 'n_docs': n_docs, 'wall_s': round(wall, 4),
+                      'docs_per_s': round(n_docs / wall, 1) if wall > 0 else None,
+                      'peak_rss_mb': round(peak_rss_mb(), 1)})
+        return total
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
@@ -0,0 +1,142 @@
+# Хранилище отзывов reviews.sqlite для высокой нагрузки.
+# В 29_sqlite.py на каждую операцию открывается новое соединение, строки вставляются по одной с фиксацией после каждой,
+# а выборка по дате сравнивает строки в столбце date без индекса. ReviewStore:
+# - включает журнал упреждающей записи (WAL), при котором чтение не блокирует запись, и synchronous=NORMAL;
+# - держит пул переиспользуемых соединений;
+# - вставляет пакеты строк одним executemany внутри одной транзакции;
+# - создает индекс по столбцу date;
+# - читает результаты запросов потоком через fetchmany с настраиваемым arraysize;
+# - по запросу (enable_fts) ведет полнотекстовый индекс FTS5 по отзывам, который триггеры синхронизируют с review_db.
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS review_db (review TEXT, sentiment INTEGER, date TEXT)',
+          'CREATE INDEX IF NOT EXISTS review_db_date ON review_db (date)')
+
+# Индекс FTS5 с внешним содержимым: сам текст хранится только в review_db, индекс ссылается на rowid строк
+FTS_SCHEMA = ("CREATE VIRTUAL TABLE review_fts USING fts5(review, content='review_db', content_rowid='rowid')",
+              'CREATE TRIGGER review_fts_insert AFTER INSERT ON review_db BEGIN '
+              'INSERT INTO review_fts (rowid, review) VALUES (new.rowid, new.review); END',
+              'CREATE TRIGGER review_fts_delete AFTER DELETE ON review_db BEGIN '
+              "INSERT INTO review_fts (review_fts, rowid, review) VALUES ('delete', old.rowid, old.review); END",
+              'CREATE TRIGGER review_fts_update AFTER UPDATE ON review_db BEGIN '
+              "INSERT INTO review_fts (review_fts, rowid, review) VALUES ('delete', old.rowid, old.review); "
+              'INSERT INTO review_fts (rowid, review) VALUES (new.rowid, new.review); END',
+              "INSERT INTO review_fts (review_fts) VALUES ('rebuild')")
+
+INSERT = "INSERT INTO review_db (review, sentiment, date) VALUES (?, ?, COALESCE(?, DATETIME('now')))"
+
+
+def connect(path, timeout=30.0):
+    # isolation_level=None - транзакциями управляем сами (BEGIN/COMMIT), check_same_thread=False - соединения из пула
+    # используются разными потоками, но каждое в один момент времени только одним
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class ReviewStore(object):
+    def __init__(self, path='reviews.sqlite', pool_size=4, timeout=30.0):
+        self.path = path
+        self._pool = queue.Queue()
+        self._all = []
+        for _ in range(pool_size):
+            conn = connect(path, timeout)
+            self._all.append(conn)
+            self._pool.put(conn)
+        with self.connection() as conn:
+            for sql in SCHEMA:
+                conn.execute(sql)
+
+    # Соединение из пула; возвращается в пул по выходе из блока with
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # Транзакция: BEGIN IMMEDIATE сразу берет блокировку записи, чтобы не получить SQLITE_BUSY посреди пакета
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    # rows - кортежи (review, sentiment) или (review, sentiment, date); без даты используется DATETIME('now')
+    def insert_many(self, rows):
+        rows = [tuple(row) if len(row) == 3 else (row[0], row[1], None) for row in rows]
+        with self.transaction() as conn:
+            conn.executemany(INSERT, rows)
+        return len(rows)
+
+    def insert(self, review, sentiment, date=None):
+        return self.insert_many([(review, sentiment, date)])
+
+    # Потоковое чтение результата запроса: строки запрашиваются у SQLite пакетами по arraysize.
+    # Соединение остается занятым, пока генератор не исчерпан или не закрыт.
+    def iter_query(self, sql, params=(), arraysize=1000):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = arraysize
+            cursor.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany()
+                    if not rows:
+                        return
+                    for row in rows:
+                        yield row
+            finally:
+                cursor.close()
+
+    # Отзывы за период [start, end], выборка использует индекс по date
+    def iter_between(self, start, end, arraysize=1000):
+        return self.iter_query('SELECT review, sentiment, date FROM review_db WHERE date BETWEEN ? AND ? ORDER BY date',
+                               (start, end), arraysize)
+
+    def has_fts(self):
+        with self.connection() as conn:
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'review_fts'").fetchone() is not None
+
+    # Создает индекс FTS5 и триггеры (они хранятся в самом файле базы, поэтому индекс поддерживается при любой записи
+    # в review_db, в том числе из 29_sqlite.py) и индексирует уже имеющиеся строки
+    def enable_fts(self):
+        if self.has_fts():
+            return
+        with self.transaction() as conn:
+            for sql in FTS_SCHEMA:
+                conn.execute(sql)
+
+    # Полнотекстовый поиск: query - запрос FTS5 ('love AND movie', 'act*'), при phrase=True ищется точная фраза.
+    # Результаты упорядочены по релевантности (bm25).
+    def search(self, query, limit=100, phrase=False):
+        if phrase:
+            query = '"%s"' % query.replace('"', '""')
+        with self.connection() as conn:
+            return conn.execute('SELECT review_db.rowid, review_db.review, review_db.sentiment, review_db.date '
+                                'FROM review_fts JOIN review_db ON review_db.rowid = review_fts.rowid '
+                                'WHERE review_fts MATCH ? ORDER BY review_fts.rank LIMIT ?', (query, limit)).fetchall()
+
+    def count(self):
+        with self.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM review_db').fetchone()[0]
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+        self._all = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
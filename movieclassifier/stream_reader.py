@@ -0,0 +1,49 @@
+# Потоковое чтение корпуса отзывов крупными блоками, в том числе из сжатых файлов.
+# stream_docs из 27_big_data_out_of_core.py считает, что каждый отзыв занимает одну строку, и отрезает метку как
+# line[:-3], int(line[-2]), поэтому отзывы в кавычках с переводами строк внутри разбираются неверно, а кавычки остаются в тексте.
+# Здесь файл читается блоками по chunk_size байт, декодируется из UTF-8 целыми блоками и разбирается модулем csv
+# (его разбор написан на C и правильно обрабатывает кавычки). Файлы gzip, bz2 и xz распознаются по сигнатуре
+# и распаковываются на лету. Вместо одного кортежа за раз возвращаются пакеты (texts, labels).
+import bz2
+import csv
+import gzip
+import io
+import lzma
+from itertools import islice
+
+# Сигнатуры сжатых форматов в начале файла
+_MAGIC = ((b'\x1f\x8b', gzip.open),
+          (b'BZh', bz2.open),
+          (b'\xfd7zXZ\x00', lzma.open))
+
+
+# Открывает файл в двоичном режиме, при необходимости распаковывая его
+def open_corpus(path, chunk_size=2**22):
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, opener in _MAGIC:
+        if head.startswith(magic):
+            return io.BufferedReader(opener(path, 'rb'), buffer_size=chunk_size)
+    return open(path, 'rb', buffering=chunk_size)
+
+
+# Генератор пакетов (texts, labels) по batch_size документов; последний пакет может быть неполным
+def stream_batches(path, batch_size=1000, chunk_size=2**22):
+    with open_corpus(path, chunk_size) as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        text._CHUNK_SIZE = chunk_size  # декодируем блоками того же размера, а не по 8 Кб
+        rows = csv.reader(text)
+        next(rows)  # пропускаем заголовок
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            texts, labels = zip(*batch)
+            yield list(texts), [int(label) for label in labels]
+
+
+# Замена stream_docs с тем же интерфейсом: по одному кортежу (текст, метка), поэтому подходит для get_minibatch
+def stream_docs(path, chunk_size=2**22):
+    for texts, labels in stream_batches(path, chunk_size=chunk_size):
+        for doc in zip(texts, labels):
+            yield doc
@@ -0,0 +1,89 @@
+# Однопроходный лексемизатор для отзывов о кинофильмах.
+# Исходная функция tokenizer из 27_big_data_out_of_core.py делает четыре прохода по тексту (удаление html-разметки, поиск эмограмм,
+# разбиение по [\W]+, перевод в нижний регистр) и проверяет каждое слово по списку стоп-слов, т.е. за O(len(stop)).
+# Здесь текст один раз переводится в нижний регистр, после чего одно скомпилированное регулярное выражение за один проход
+# пропускает html-теги и выделяет эмограммы и слова, а стоп-слова хранятся в неизменяемом хэш-множестве frozenset.
+#
+# Отличия от исходной функции:
+# - эмограммы остаются в тексте на своем месте, а не дописываются в конец (для мешка слов порядок не важен);
+# - исходная функция приклеивала первую эмограмму к последнему слову, если текст заканчивался буквой ('movie:)'),
+#   здесь эмограмма всегда отдельная лексема;
+# - слова по обе стороны html-тега не склеиваются ('a<br />b' дает 'a' и 'b', а не 'ab').
+# Варианты эмограмм ':D' и ':P' исходная функция искала в тексте после lower(), т.е. никогда не находила, поэтому они не ищутся и здесь.
+import re
+import string
+
+# Для html-тега группа не захватывается и findall возвращает пустую строку, которую отбрасываем вместе со стоп-словами
+_TOKEN_PATTERN = r'<[^>]*>|((?::|;|=)-?[)(]|\w+)'
+_TOKEN_RE = re.compile(_TOKEN_PATTERN)
+# Для текста только из ASCII-символов \w с флагом re.ASCII совпадает с юникодным, а проверяется на треть быстрее;
+# str.isascii() почти ничего не стоит
+_ASCII_TOKEN_RE = re.compile(_TOKEN_PATTERN, re.ASCII)
+_TAG_RE = re.compile(r'<[^>]*>')
+_EMOTICON_RE = re.compile(r'[:;=]-?[)(]')
+# Большинство отзывов - ASCII-текст без эмограмм. Для него регулярное выражение не нужно: bytes.translate за один
+# проход по байтам переводит буквы в нижний регистр и заменяет все, кроме [a-zA-Z0-9_], пробелом, а split() режет
+# по пробелам. Результат тот же, что у _ASCII_TOKEN_RE, но в несколько раз быстрее.
+_WORD_BYTES = (string.ascii_letters + string.digits + '_').encode()
+_ASCII_WORD_TABLE = bytes(c if c in _WORD_BYTES else 32 for c in range(256)).lower()
+
+
+class Tokenizer(object):
+    def __init__(self, stop_words=()):
+        self.stop_words = frozenset(stop_words) | frozenset([''])
+
+    def __call__(self, text):
+        stop = self.stop_words
+        # эмограмма невозможна без скобки, а поиск подстроки намного дешевле поиска по регулярному выражению
+        if text.isascii() and not (('(' in text or ')' in text) and _EMOTICON_RE.search(text)):
+            if '<' in text:
+                text = _TAG_RE.sub(' ', text)
+            return [w for w in text.encode().translate(_ASCII_WORD_TABLE).decode().split() if w not in stop]
+        text = text.lower()
+        tokens = [w for w in (_ASCII_TOKEN_RE if text.isascii() else _TOKEN_RE).findall(text) if w not in stop]
+        # '-' внутри лексемы бывает только в эмограмме с носом (':-)'), поэтому лишний проход по лексемам
+        # нужен лишь тогда, когда в тексте вообще есть '-'
+        if '-' in text:
+            tokens = [w.replace('-', '') if '-' in w else w for w in tokens]
+        return tokens
+
+    # Представление не зависит от адреса объекта и порядка элементов множества, поэтому годится для ключа кэша признаков
+    def __repr__(self):
+        return 'Tokenizer(stop_words=%r)' % sorted(self.stop_words - frozenset(['']))
+
+    # Пакетная лексемизация списка документов
+    def tokenize_batch(self, docs):
+        return list(map(self, docs))
+
+
+# Исходная трехрегулярная функция, оставлена для сравнения скорости
+def legacy_tokenizer(text, stop=()):
+    text = re.sub('<[^>]*>', '', text)
+    emoticons = re.findall('(?::|;|=)(?:-)?(?:\)|\(|D|P)', text.lower())
+    text = re.sub('[\W]+', ' ', text.lower()) + ' '.join(emoticons).replace('-', '')
+    tokenized = [w for w in text.split() if w not in stop]
+    return tokenized
+
+
+# Сравнение скорости на movie_data.csv: python -m movieclassifier.tokenizer ./data/movie_data.csv
+if __name__ == '__main__':
+    import sys
+    import time
+    import pandas as pd
+    from .vectorizer import stop
+
+    path = sys.argv[1] if len(sys.argv) > 1 else './data/movie_data.csv'
+    docs = pd.read_csv(path)['review'].tolist()
+    tok = Tokenizer(stop)
+
+    start = time.time()
+    for doc in docs:
+        legacy_tokenizer(doc, stop)
+    legacy = len(docs) / (time.time() - start)
+
+    start = time.time()
+    tok.tokenize_batch(docs)
+    fast = len(docs) / (time.time() - start)
+
+    print('Исходный tokenizer: %.0f док/с' % legacy)
+    print('Tokenizer.tokenize_batch: %.0f док/с (x%.1f)' % (fast, fast / legacy))
@@ -0,0 +1,71 @@
+# Многоэпохное потоковое обучение с ранней остановкой для классификаторов с partial_fit.
+# В 27_big_data_out_of_core.py модель проходит по 45 мини-пакетам один раз, а затем дообучается на тех же 5000 документах,
+# на которых ее оценивали. StreamingTrainer выполняет несколько эпох (поток мини-пакетов запрашивается заново в каждой эпохе,
+# поэтому его можно перемешивать), после каждой эпохи считает потери на отложенной проверочной выборке, на которой модель
+# никогда не обучается, и останавливается, если потери перестали уменьшаться. Лучшая модель сохраняется как контрольная точка.
+import copy
+import os
+import pickle
+
+import numpy as np
+from sklearn.metrics import log_loss
+
+
+class StreamingTrainer(object):
+    # patience - сколько эпох подряд без улучшения больше чем на tol допускается до остановки,
+    # checkpoint_path - файл, куда консервируется лучшая модель (None - хранить только в памяти),
+    # vect - векторизатор, если мини-пакеты содержат тексты, а не готовые матрицы признаков.
+    def __init__(self, clf, classes, max_epochs=10, patience=2, tol=1e-4, checkpoint_path=None, vect=None):
+        self.clf = clf
+        self.classes = np.asarray(classes)
+        self.max_epochs = max_epochs
+        self.patience = patience
+        self.tol = tol
+        self.checkpoint_path = checkpoint_path
+        self.vect = vect
+
+    def _features(self, X):
+        return self.vect.transform(X) if self.vect is not None else X
+
+    # Потери на проверочной выборке: логистические потери, если классификатор умеет predict_proba, иначе доля ошибок
+    def validation_loss(self, val_batches):
+        total, n = 0.0, 0
+        for X, y in val_batches:
+            X = self._features(X)
+            if hasattr(self.clf, 'predict_proba'):
+                total += log_loss(y, self.clf.predict_proba(X), labels=self.classes) * len(y)
+            else:
+                total += np.sum(self.clf.predict(X) != np.asarray(y))
+            n += len(y)
+        return total / n
+
+    def _checkpoint(self):
+        self.best_estimator_ = copy.deepcopy(self.clf)
+        if self.checkpoint_path is not None:
+            tmp = self.checkpoint_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(self.best_estimator_, f, protocol=4)
+            os.replace(tmp, self.checkpoint_path)
+
+    # train_batches(epoch) и val_batches() возвращают новые потоки мини-пакетов (X, y) для каждого вызова
+    def fit(self, train_batches, val_batches):
+        self.history_ = []
+        self.best_loss_ = np.inf
+        self.best_epoch_ = None
+        wait = 0
+        for epoch in range(self.max_epochs):
+            n_docs = 0
+            for X, y in train_batches(epoch):
+                self.clf.partial_fit(self._features(X), y, classes=self.classes)
+                n_docs += len(y)
+            loss = self.validation_loss(val_batches())
+            self.history_.append({'epoch': epoch, 'n_docs': n_docs, 'val_loss': loss})
+            if loss < self.best_loss_ - self.tol:
+                self.best_loss_, self.best_epoch_ = loss, epoch
+                self._checkpoint()
+                wait = 0
+            else:
+                wait += 1
+                if wait >= self.patience:
+                    break
+        return self
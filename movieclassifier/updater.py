@@ -0,0 +1,140 @@
+# Фоновое дообучение классификатора на отзывах пользователей из review_db.
+# Веб-приложение сохраняет обратную связь в reviews.sqlite, но классификатор ее не использует без полного переобучения.
+# Updater читает крупными пакетами только строки, добавленные после сохраненной отметки (watermark - наибольший rowid
+# уже учтенной строки), дообучает копию SGDClassifier методом partial_fit и атомарно заменяет classifier.pkl
+# (запись во временный файл и os.replace). Работающие сервисы замечают новый файл (ModelWatcher в service.py)
+# или получают сигнал SIGHUP и подменяют модель без остановки.
+#
+# Отметка сохраняется после замены модели, поэтому при сбое между этими шагами последние строки будут учтены повторно,
+# но никогда не будут пропущены.
+#
+# Вместе с rowid в отметке хранится дата последней учтенной строки. Если отметка больше MAX(rowid) (строку с наибольшим
+# rowid удалили, и SQLite выдает новым строкам освободившиеся номера), новые строки выбираются по дате: возможно
+# повторное обучение на строках той же секунды, но не пропуск.
+#
+# python -m movieclassifier.updater --db reviews.sqlite --interval 60 --notify-pid 12345
+import argparse
+import json
+import os
+import pickle
+import signal
+import time
+
+import numpy as np
+
+from .storage import ReviewStore
+from .vectorizer import cur_dir, vect
+
+DEFAULT_MODEL = os.path.join(cur_dir, 'pkl_objects', 'classifier.pkl')
+
+
+# Отметка {'rowid': ..., 'date': ...}; в отметках прежних версий даты нет
+def load_watermark(path):
+    if not os.path.exists(path):
+        return {'rowid': 0, 'date': None}
+    with open(path) as f:
+        mark = json.load(f)
+    mark.setdefault('date', None)
+    return mark
+
+
+def _atomic_write(path, write):
+    tmp = '%s.tmp-%d' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_watermark(path, rowid, date=None):
+    _atomic_write(path, lambda f: f.write(json.dumps({'rowid': rowid, 'date': date}).encode('utf-8')))
+
+
+class Updater(object):
+    # watermark_path по умолчанию лежит рядом с моделью, notify_pids - процессы, которым после замены модели
+    # отправляется SIGHUP
+    def __init__(self, store, model_path=DEFAULT_MODEL, watermark_path=None, batch_size=10000, vectorizer=vect,
+                 notify_pids=()):
+        self.store = store
+        self.model_path = model_path
+        self.watermark_path = watermark_path or os.path.join(os.path.dirname(model_path), 'watermark.json')
+        self.batch_size = batch_size
+        self.vectorizer = vectorizer
+        self.notify_pids = list(notify_pids)
+
+    # Запрос новых строк: по rowid, а если отметка больше MAX(rowid) - по дате последней учтенной строки
+    def _new_rows(self, mark):
+        sql = 'SELECT rowid, review, sentiment, date FROM review_db WHERE %s ORDER BY rowid'
+        with self.store.connection() as conn:
+            max_rowid = conn.execute('SELECT MAX(rowid) FROM review_db').fetchone()[0] or 0
+        if mark['rowid'] <= max_rowid:
+            return self.store.iter_query(sql % 'rowid > ?', (mark['rowid'],), arraysize=self.batch_size)
+        print('Отметка rowid=%d больше MAX(rowid)=%d: номера строк использованы повторно, новые строки выбираются '
+              'по дате после %s' % (mark['rowid'], max_rowid, mark['date']))
+        if mark['date'] is None:
+            return self.store.iter_query(sql % '1', arraysize=self.batch_size)
+        return self.store.iter_query(sql % 'date >= ?', (mark['date'],), arraysize=self.batch_size)
+
+    # Один цикл дообучения; возвращает число учтенных отзывов (0 - новых отзывов нет, модель не менялась)
+    def update_once(self):
+        mark = load_watermark(self.watermark_path)
+        rows = self._new_rows(mark)
+        last_date = mark['date']
+        clf = None
+        n = 0
+        while True:
+            batch = [row for _, row in zip(range(self.batch_size), rows)]
+            if not batch:
+                break
+            if clf is None:
+                # копия текущей модели: обслуживающие процессы продолжают работать со старым файлом
+                with open(self.model_path, 'rb') as f:
+                    clf = pickle.load(f)
+            rowids, reviews, sentiments, dates = zip(*batch)
+            clf.partial_fit(self.vectorizer.transform(reviews), np.array(sentiments), classes=clf.classes_)
+            watermark = rowids[-1]
+            last_date = max(dates) if last_date is None else max(last_date, max(dates))
+            n += len(batch)
+        if clf is None:
+            return 0
+        _atomic_write(self.model_path, lambda f: pickle.dump(clf, f, protocol=4))
+        save_watermark(self.watermark_path, watermark, last_date)
+        for pid in self.notify_pids:
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except OSError:
+                pass
+        return n
+
+    def run(self, interval=60.0):
+        while True:
+            n = self.update_once()
+            if n:
+                print('Модель дообучена на %d новых отзывах' % n)
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Фоновое дообучение классификатора на отзывах из review_db')
+    parser.add_argument('--db', default='reviews.sqlite')
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--interval', type=float, default=60.0)
+    parser.add_argument('--once', action='store_true', help='выполнить один цикл и выйти')
+    parser.add_argument('--notify-pid', type=int, nargs='*', default=[], help='процессы сервиса для сигнала SIGHUP')
+    args = parser.parse_args(argv)
+
+    store = ReviewStore(args.db, pool_size=1)
+    updater = Updater(store, args.model, batch_size=args.batch_size, notify_pids=args.notify_pid)
+    try:
+        if args.once:
+            print('Учтено отзывов: %d' % updater.update_once())
+        else:
+            updater.run(args.interval)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,23 @@
 # Нам не нужно консервировать хэширующий векторизатор HashingVectorizer, поскольку он не требует выполнения подгонки. Вместо этого можно
 # создать новый сценарный файл Python, из которого можно импортировать векторизатор в наш текущий сеанс Python.
 from sklearn.feature_extraction.text import HashingVectorizer
-import re
+from .tokenizer import Tokenizer
 import os
 import pickle
 
-cur_dir = os.path.dirname(os.path.realpath('__file__'))
-# Костыль, нужно понять, как правильно задавать путь
-cur_dir +='/movieclassifier/'
-print(cur_dir)
+# Путь задаем относительно самого файла, а не текущего каталога, чтобы модуль можно было импортировать как из корня репозитория,
+# так и из дочерних процессов пула
+cur_dir = os.path.dirname(os.path.realpath(__file__))
 
 stop = pickle.load(open(os.path.join(cur_dir, 'pkl_objects', 'stopwords.pkl'), 'rb'))
+
+# Однопроходный лексемизатор из tokenizer.py вместо трехрегулярной функции tokenizer из 27_big_data_out_of_core.py.
+# Он сам переводит текст в нижний регистр, поэтому lowercase=False избавляет векторизатор от лишнего прохода.
+# Экземпляр Tokenizer консервируется, поэтому векторизатор можно передавать в дочерние процессы.
+tokenizer = Tokenizer(stop)
+
+vect = HashingVectorizer(decode_error='ignore',
+                         n_features=2**21,
+                         preprocessor=None,
+                         lowercase=False,
+                         tokenizer=tokenizer)
@@ -0,0 +1 @@
+# Вспомогательные модули предобработки текстов для скриптов анализа мнений (26_nlp_tf_idf.py, 67_Aim_Predict_Rating.py).
@@ -0,0 +1,130 @@
+# Параллельная предобработка текстов.
+# df['review'].apply(preprocessor) в 26_nlp_tf_idf.py и циклы с review_to_wordlist в 67_Aim_Predict_Rating.py
+# обрабатывают отзывы по одному на одном ядре. Здесь последовательность текстов (Series, список или генератор,
+# например, столбец из pd.read_csv(chunksize=...)) делится на блоки по chunk_size, блоки обрабатываются пулом процессов,
+# а результаты возвращаются по мере готовности в исходном порядке. Одновременно в работе не больше n_jobs * prefetch
+# блоков, поэтому память не зависит от размера входных данных, если их читать потоком.
+# func должна быть функцией верхнего уровня модуля (или скрипта) или объектом с методом __call__, чтобы ее можно было
+# передать в дочерние процессы. func передается каждому процессу пула один раз при его запуске (initializer), а не с
+# каждым блоком, поэтому состояние объекта (например, таблица MemoStemmer) накапливается от блока к блоку. Если у func
+# есть методы counters() и add_counters(delta), приращения счетчиков в процессах пула прибавляются к func в родителе,
+# и статистика (например, ReviewCleaner.stemmer.stats()) не теряется.
+# Процессы порождаются через fork (где он есть): при spawn дочерний процесс заново выполнил бы весь скрипт,
+# а учебные скрипты не защищены проверкой if __name__ == '__main__'.
+import multiprocessing
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+import pandas as pd
+
+
+def _context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+
+# Функция текущего процесса пула, задается _init_worker
+_func = None
+
+
+def _init_worker(func):
+    global _func
+    _func = func
+
+
+def _apply_chunk(func, chunk):
+    return [func(text) for text in chunk]
+
+
+# Выполняется в процессе пула: результаты блока и приращения счетчиков func (или None)
+def _worker_chunk(chunk):
+    before = _func.counters() if hasattr(_func, 'counters') else None
+    result = _apply_chunk(_func, chunk)
+    if before is None:
+        return result, None
+    after = _func.counters()
+    return result, dict((k, after[k] - before.get(k, 0)) for k in after)
+
+
+def iter_chunks(texts, chunk_size):
+    it = iter(texts)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Progress(object):
+    # Строка прогресса в stderr: обработано текстов, из скольких (если известно) и скорость
+    def __init__(self, total=None, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self.start = time.time()
+
+    def update(self, n):
+        self.done += n
+        elapsed = max(time.time() - self.start, 1e-9)
+        of = ' из %d' % self.total if self.total is not None else ''
+        self.stream.write('\rОбработано %d%s (%.0f текстов/с)' % (self.done, of, self.done / elapsed))
+        self.stream.flush()
+
+    def close(self):
+        self.stream.write('\n')
+        self.stream.flush()
+
+
+# Генератор списков результатов по блокам в исходном порядке.
+# n_jobs=None - по числу ядер, n_jobs=1 - последовательно в текущем процессе.
+def imap_chunks(func, texts, chunk_size=1000, n_jobs=None, prefetch=2, progress=True):
+    total = len(texts) if hasattr(texts, '__len__') else None
+    bar = Progress(total) if progress else None
+    n_jobs = n_jobs if n_jobs is not None else multiprocessing.cpu_count()
+    try:
+        if n_jobs == 1:
+            for chunk in iter_chunks(texts, chunk_size):
+                result = _apply_chunk(func, chunk)
+                if bar is not None:
+                    bar.update(len(result))
+                yield result
+            return
+        pool = _context().Pool(n_jobs, initializer=_init_worker, initargs=(func,))
+        try:
+            pending = deque()
+            chunks = iter_chunks(texts, chunk_size)
+            for chunk in chunks:
+                pending.append(pool.apply_async(_worker_chunk, (chunk,)))
+                if len(pending) >= n_jobs * prefetch:
+                    break
+            while pending:
+                result, delta = pending.popleft().get()
+                if delta is not None and hasattr(func, 'add_counters'):
+                    func.add_counters(delta)
+                # на место готового блока сразу отправляем следующий
+                for chunk in islice(chunks, 1):
+                    pending.append(pool.apply_async(_worker_chunk, (chunk,)))
+                if bar is not None:
+                    bar.update(len(result))
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        if bar is not None:
+            bar.close()
+
+
+# Результаты по одному в исходном порядке
+def imap_texts(func, texts, chunk_size=1000, n_jobs=None, prefetch=2, progress=True):
+    for result in imap_chunks(func, texts, chunk_size, n_jobs, prefetch, progress):
+        for item in result:
+            yield item
+
+
+# Аналог series.apply(func) на пуле процессов: Series с тем же индексом
+def parallel_apply(series, func, chunk_size=1000, n_jobs=None, progress=True):
+    return pd.Series(list(imap_texts(func, series.values, chunk_size, n_jobs, progress=progress)),
+                     index=series.index, name=series.name)
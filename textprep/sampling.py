@@ -0,0 +1,110 @@
+# Случайная выборка строк большого CSV за один проход.
+# В 67_Aim_Predict_Rating.py для выборки 20 000 строк из 413 000 строится отсортированный список 393 000 номеров
+# пропускаемых строк для pd.read_csv(skiprows=...), а число строк файла n нужно знать заранее. sample_csv читает файл
+# блоками pd.read_csv(chunksize=...) и не требует знать число строк:
+# - n строк - выборка с равными вероятностями без возвращения: каждой строке назначается случайный ключ и хранятся
+#   n строк с наименьшими ключами (то же, что выборка из резервуара, но целыми блоками);
+# - frac - выборка Бернулли: каждая строка попадает в выборку с вероятностью frac;
+# - stratify - имя столбца (например, 'Rating'): для n хранится до n строк с наименьшими ключами в каждой группе, а после
+#   прохода каждой группе выделяется доля n, пропорциональная ее размеру; frac можно задать словарем {группа: доля}.
+# Строки возвращаются в порядке файла, индекс DataFrame - номер строки данных (с нуля, без заголовка).
+#
+# Для повторных выборок из того же файла row_index один раз строит индекс смещений строк (path + '.rows.npz'),
+# и read_rows / sample_indexed читают только нужные строки, за время, пропорциональное размеру выборки.
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from movieclassifier.corpus_index import file_signature, iter_records
+
+
+# Число строк каждой группе: пропорционально размеру группы, остаток - группам с наибольшей дробной частью
+def _allocate(counts, n):
+    if n >= counts.sum():
+        return counts
+    quota = counts * float(n) / counts.sum()
+    alloc = np.floor(quota).astype(int)
+    rest = n - alloc.sum()
+    order = np.argsort(-(quota - alloc).values, kind='stable')[:rest]
+    alloc.iloc[order] += 1
+    return alloc
+
+
+def sample_csv(path, n=None, frac=None, stratify=None, seed=None, chunksize=100000, **read_csv_kwargs):
+    if (n is None) == (frac is None):
+        raise ValueError('Нужно задать ровно один из параметров n или frac')
+    rng = np.random.RandomState(seed)
+    parts, kept, counts = [], None, None
+    pos = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs):
+        chunk.index = pd.RangeIndex(pos, pos + len(chunk))
+        pos += len(chunk)
+        keys = rng.random_sample(len(chunk))
+        if frac is not None:
+            if isinstance(frac, dict):
+                p = chunk[stratify].map(frac).fillna(0).values
+            else:
+                p = frac
+            parts.append(chunk[keys < p])
+            continue
+        chunk = chunk.assign(_key=keys)
+        kept = chunk if kept is None else pd.concat([kept, chunk])
+        if stratify is None:
+            kept = kept.nsmallest(n, '_key')
+        else:
+            kept = kept.sort_values('_key').groupby(stratify, sort=False, dropna=False).head(n)
+            c = chunk[stratify].value_counts(dropna=False)
+            counts = c if counts is None else counts.add(c, fill_value=0)
+    if frac is not None:
+        return pd.concat(parts) if parts else pd.read_csv(path, nrows=0, **read_csv_kwargs)
+    if kept is None:
+        return pd.read_csv(path, nrows=0, **read_csv_kwargs)
+    if stratify is not None:
+        alloc = _allocate(counts.astype(int), n)
+        kept = kept.sort_values('_key')
+        rank = kept.groupby(stratify, sort=False, dropna=False).cumcount()
+        kept = kept[rank.values < kept[stratify].map(alloc).values]
+    return kept.drop('_key', axis=1).sort_index()
+
+
+def rows_path(path):
+    return path + '.rows.npz'
+
+
+# Смещения начала строк данных (последний элемент - размер файла); индекс строится один раз и сохраняется рядом с файлом
+# вместе с размером и временем изменения файла (file_signature), по которым проверяется, что он не устарел
+def row_index(path, rebuild=False):
+    idx = rows_path(path)
+    if not rebuild and os.path.exists(idx):
+        with np.load(idx) as data:
+            if np.array_equal(data['signature'], file_signature(path)):
+                return data['offsets']
+    signature = file_signature(path)
+    offsets = np.array([start for start, _ in iter_records(path)], dtype=np.int64)
+    np.savez(idx, offsets=offsets, signature=signature)
+    return offsets
+
+
+# Строки с номерами positions (в порядке возрастания) как DataFrame с теми же номерами в индексе
+def read_rows(path, positions, **read_csv_kwargs):
+    offsets = row_index(path)
+    positions = np.sort(np.asarray(positions, dtype=np.int64))
+    chunks = []
+    with open(path, 'rb') as f:
+        chunks.append(f.readline())  # заголовок
+        for i in positions:
+            f.seek(offsets[i])
+            raw = f.read(offsets[i + 1] - offsets[i])
+            chunks.append(raw if raw.endswith(b'\n') else raw + b'\n')
+    df = pd.read_csv(io.BytesIO(b''.join(chunks)), **read_csv_kwargs)
+    df.index = positions
+    return df
+
+
+# Повторная выборка n строк без возвращения по индексу смещений, без чтения всего файла
+def sample_indexed(path, n, seed=None, **read_csv_kwargs):
+    n_rows = len(row_index(path)) - 1
+    positions = np.random.RandomState(seed).choice(n_rows, min(n, n_rows), replace=False)
+    return read_rows(path, positions, **read_csv_kwargs)
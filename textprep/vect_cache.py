@@ -0,0 +1,129 @@
+# Общий кэш результатов TfidfVectorizer для сеточного поиска.
+# В 26_nlp_tf_idf.py GridSearchCV для каждого набора параметров и каждого блока перекрестной проверки заново лексемизирует
+# и векторизует 20 000 отзывов, хотя при смене одних только clf__C или clf__penalty результат векторизации тот же.
+# CachedTfidfVectorizer - это TfidfVectorizer с дополнительным параметром cache_dir. Результат fit_transform хранится
+# под ключом (параметры векторизатора, хэш содержимого документов блока - то же, что номера строк блока), а результат
+# transform - под ключом (ключ подгонки, хэш документов). CSR-матрицы сохраняются массивами .npy и читаются
+# с отображением в память, поэтому все процессы GridSearchCV(n_jobs=-1) пользуются одним кэшем и общими страницами
+# в кэше ОС. Пока один процесс вычисляет запись, другие процессы с тем же ключом ждут ее на блокировке файла,
+# а не считают то же самое параллельно.
+# Функции в параметрах (tokenizer, preprocessor) входят в ключ именем и хэшем своего текста, а объекты - через repr.
+# Если изменилось то, что функция использует, но не ее текст (глобальные переменные, импортированный модуль),
+# каталог cache_dir нужно очистить вручную.
+import fcntl
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from movieclassifier.feature_cache import vectorizer_config
+
+
+# Хэш содержимого документов в их порядке
+def docs_checksum(docs):
+    h = hashlib.sha1()
+    for doc in docs:
+        h.update(doc.encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+# Индексы сортируются до записи: liblinear и другие решатели упорядочивают их на месте и не справляются с неизменяемыми
+# массивами. Массивы читаются с mmap_mode='c' (копирование при записи): страницы общие, пока их никто не меняет.
+def _save_csr(path, X):
+    X.sum_duplicates()
+    X.sort_indices()
+    for part in ('data', 'indices', 'indptr'):
+        np.save(os.path.join(path, part + '.npy'), getattr(X, part))
+    np.save(os.path.join(path, 'shape.npy'), np.array(X.shape, dtype=np.int64))
+
+
+def _load_csr(path):
+    data, indices, indptr = [np.load(os.path.join(path, part + '.npy'), mmap_mode='c')
+                             for part in ('data', 'indices', 'indptr')]
+    X = csr_matrix((data, indices, indptr), shape=tuple(np.load(os.path.join(path, 'shape.npy'))), copy=False)
+    X.has_sorted_indices = True
+    return X
+
+
+class CachedTfidfVectorizer(TfidfVectorizer):
+    # cache_dir=None - обычный TfidfVectorizer без кэша. Остальные параметры передаются TfidfVectorizer, поэтому
+    # сетка параметров vect__* в GridSearchCV не меняется.
+    def __init__(self, cache_dir=None, **kwargs):
+        super(CachedTfidfVectorizer, self).__init__(**kwargs)
+        self.cache_dir = cache_dir
+
+    @classmethod
+    def _get_param_names(cls):
+        return sorted(TfidfVectorizer._get_param_names() + ['cache_dir'])
+
+    def _params_key(self):
+        params = self.get_params()
+        params.pop('cache_dir')
+        return vectorizer_config(TfidfVectorizer(**params))
+
+    # Возвращает запись кэша key: если ее нет, вычисляет compute() под блокировкой и сохраняет.
+    # compute возвращает матрицу и (для подгонки) словарь подогнанных атрибутов.
+    def _cached(self, key, compute):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        path = os.path.join(self.cache_dir, digest)
+        if not os.path.exists(path):
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.exists(path):
+                    X, state = compute()
+                    tmp = tempfile.mkdtemp(dir=self.cache_dir)
+                    try:
+                        _save_csr(tmp, X.tocsr())
+                        if state is not None:
+                            with open(os.path.join(tmp, 'state.pkl'), 'wb') as f:
+                                pickle.dump(state, f, protocol=4)
+                        os.rename(tmp, path)
+                    except BaseException:
+                        shutil.rmtree(tmp, ignore_errors=True)
+                        raise
+                    return digest, X, state
+        state = None
+        if os.path.exists(os.path.join(path, 'state.pkl')):
+            with open(os.path.join(path, 'state.pkl'), 'rb') as f:
+                state = pickle.load(f)
+        return digest, _load_csr(path), state
+
+    # Подогнанные атрибуты (словарь, idf и т.п.) без stop_words_, который нужен только для отладки и бывает большим
+    def _fitted_state(self):
+        return dict((k, v) for k, v in self.__dict__.items()
+                    if (k.endswith('_') and not k.startswith('__') and k != 'stop_words_') or k == '_tfidf')
+
+    def fit_transform(self, raw_documents, y=None):
+        if self.cache_dir is None:
+            return super(CachedTfidfVectorizer, self).fit_transform(raw_documents, y)
+
+        def compute():
+            X = super(CachedTfidfVectorizer, self).fit_transform(raw_documents, y)
+            return X, self._fitted_state()
+
+        key = 'fit\n%s\n%s' % (self._params_key(), docs_checksum(raw_documents))
+        self._fit_key, X, state = self._cached(key, compute)
+        self.__dict__.update(state)
+        return X
+
+    def fit(self, raw_documents, y=None):
+        self.fit_transform(raw_documents, y)
+        return self
+
+    def transform(self, raw_documents):
+        if self.cache_dir is None or getattr(self, '_fit_key', None) is None:
+            return super(CachedTfidfVectorizer, self).transform(raw_documents)
+
+        def compute():
+            return super(CachedTfidfVectorizer, self).transform(raw_documents), None
+
+        key = 'transform\n%s\n%s' % (self._fit_key, docs_checksum(raw_documents))
+        return self._cached(key, compute)[1]